@@ -1,13 +1,41 @@
-import tkinter as tk
-from tkinter import font as tkfont
-from tkinter import filedialog, messagebox
 import shutil
 from pathlib import Path
 import zipfile
-from datetime import datetime, timedelta
+import zlib
+import bz2
+import lzma
+import tarfile
+import time
+import itertools
+import warnings
+import tempfile
+from datetime import datetime
 import os
 import threading
-from tkinter import ttk
+import json
+from collections import namedtuple, deque
+from array import array
+from types import MappingProxyType
+import sqlite3
+import hashlib
+import heapq
+import re
+import sys
+import errno
+import select
+import struct
+
+# tkinter se importa solo al abrir la interfaz (_cargar_tkinter), así el uso sin pantalla arranca rápido;
+# por lo mismo ctypes y concurrent.futures se importan dentro de las funciones que los usan.
+tk = tkfont = filedialog = messagebox = ttk = None
+
+
+def _cargar_tkinter():
+    global tk, tkfont, filedialog, messagebox, ttk
+    if tk is None:
+        import tkinter
+        from tkinter import font, filedialog as dialogos, messagebox as mensajes, ttk as temas
+        tk, tkfont, filedialog, messagebox, ttk = tkinter, font, dialogos, mensajes, temas
 
 
 # ------------------ CATEGORÍAS DE ARCHIVOS ------------------
@@ -16,88 +44,1245 @@ CATEGORIES = {
     'Documentos': ['.pdf', '.doc', '.docx', '.txt', '.xls', '.xlsx', '.ppt', '.pptx'],
     'Vídeos': ['.mp4', '.avi', '.mkv', '.mov', '.wmv'],
     'Música': ['.mp3', '.wav', '.flac', '.aac'],
-    'Archivos comprimidos': ['.zip', '.rar', '.7z', '.tar', '.gz'],
+    'Archivos comprimidos': ['.zip', '.rar', '.7z', '.tar', '.gz', '.tar.gz', '.tar.bz2', '.tar.xz'],
     'Otros': []
 }
 
 
+class ClasificadorCategorias:
+    # Tabla extensión -> categoría construida una sola vez a partir de un mapa como CATEGORIES.
+    # Admite extensiones compuestas (.tar.gz): se prueba siempre primero el sufijo más largo.
+    def __init__(self, categorias=CATEGORIES, por_defecto='Otros'):
+        tabla = {}
+        for categoria, extensiones in categorias.items():
+            for extension in extensiones:
+                tabla.setdefault(extension.lower(), categoria)
+        self.tabla = MappingProxyType(tabla)
+        self.categorias = tuple(categorias) if por_defecto in categorias else tuple(categorias) + (por_defecto,)
+        self.por_defecto = por_defecto
+        self._max_partes = max((extension.count('.') for extension in tabla), default=1)
+
+    def categoria(self, nombre):
+        nombre = nombre.lower()
+        if self._max_partes == 1:
+            posicion = nombre.rfind('.')
+            if posicion <= 0:
+                return self.por_defecto
+            return self.tabla.get(nombre[posicion:], self.por_defecto)
+        # Los nombres que empiezan por punto (.bashrc) no tienen extensión, igual que Path.suffix
+        posicion = nombre.find('.', 1)
+        while posicion != -1:
+            sufijo = nombre[posicion:]
+            if sufijo.count('.') <= self._max_partes:
+                categoria = self.tabla.get(sufijo)
+                if categoria is not None:
+                    return categoria
+            posicion = nombre.find('.', posicion + 1)
+        return self.por_defecto
+
+
+CLASIFICADOR = ClasificadorCategorias(CATEGORIES)
+
+
+# ------------------ EXCLUSIONES ------------------
+# Patrones al estilo .gitignore que no se comprimen ni se cuentan en las estadísticas.
+# "nombre/" solo afecta a carpetas; con una "/" delante o en medio el patrón va anclado a la raíz.
+EXCLUSIONES_POR_DEFECTO = (
+    ".git/", ".hg/", ".svn/", "node_modules/", "__pycache__/", ".cache/", ".pytest_cache/", ".mypy_cache/",
+    ".tox/", "*.pyc",
+)
+
+
+def _patron_a_regex(patron):
+    anclado = "/" in patron.rstrip("/")
+    patron = patron.strip("/")
+    partes = []
+    i = 0
+    while i < len(patron):
+        if patron.startswith("**/", i):
+            partes.append("(?:.*/)?")
+            i += 3
+            continue
+        if patron.startswith("**", i):
+            partes.append(".*")
+            i += 2
+            continue
+        caracter = patron[i]
+        fin = patron.find("]", i + 2) if caracter == "[" else -1
+        if caracter == "*":
+            partes.append("[^/]*")
+        elif caracter == "?":
+            partes.append("[^/]")
+        elif fin != -1:
+            clase = patron[i + 1:fin]
+            if clase.startswith("!"):
+                clase = "^" + clase[1:]
+            partes.append("[" + clase.replace("\\", "\\\\") + "]")
+            i = fin
+        else:
+            partes.append(re.escape(caracter))
+        i += 1
+    regex = "".join(partes)
+    return regex if anclado else "(?:.*/)?" + regex
+
+
+class ReglasExclusion:
+    # Todos los patrones se compilan en una única regex para archivos y otra para carpetas, así cada
+    # entrada se comprueba con un solo fullmatch. Los "!patrón" vuelven a incluir lo que coincida,
+    # estén donde estén en la lista (en .gitignore importaría el orden).
+    def __init__(self, patrones=EXCLUSIONES_POR_DEFECTO):
+        archivos = []
+        carpetas = []
+        incluir = []
+        for patron in patrones:
+            patron = patron.strip()
+            if not patron or patron.startswith("#"):
+                continue
+            if patron.startswith("!"):
+                incluir.append(_patron_a_regex(patron[1:]))
+                continue
+            regex = _patron_a_regex(patron)
+            carpetas.append(regex)
+            if not patron.endswith("/"):
+                archivos.append(regex)
+        self.patrones = tuple(patrones)
+        self.huella = hashlib.sha1("\n".join(self.patrones).encode("utf-8")).hexdigest()[:12]
+        self._archivos = self._compilar(archivos, incluir)
+        self._carpetas = self._compilar(carpetas, incluir)
+
+    @staticmethod
+    def _compilar(patrones, incluir):
+        if not patrones:
+            return None
+        regex = "(?:" + "|".join(patrones) + ")"
+        if incluir:
+            regex = "(?!(?:" + "|".join(incluir) + ")\\Z)" + regex
+        return re.compile(regex, re.DOTALL)
+
+    def excluye(self, relativa, carpeta=False):
+        # relativa: ruta respecto a la carpeta raíz
+        regex = self._carpetas if carpeta else self._archivos
+        if regex is None:
+            return False
+        if os.sep != "/":
+            relativa = relativa.replace(os.sep, "/")
+        return regex.fullmatch(relativa) is not None
+
+
+EXCLUSIONES = ReglasExclusion()
+
+
 # ------------------ Configuraciones Tkinter ------------------
-resolucion = "700x500"
+resolucion = "700x640"
 nombre_ventana = "FolderWizard"
 carpeta_por_defecto = None
 titulo_ventanas = "Asistente de Organización de Archivos"
 imagen_banner = "logo.png"
+intervalo_estadisticas = 5000  # entradas procesadas entre cada actualización parcial del panel
+hilos_movimiento = 8  # hilos para mover archivos en paralelo (1 = secuencial)
+tamano_bloque_copia = 8 * 1024 * 1024  # bloque para copias entre dispositivos distintos
+tamano_lote = 1000  # movimientos que se aplican de cada vez al ejecutar un plan
 nombre_dialogo_1 = "Bienvenido a FolderWizard"
 descripcion_dialogo_1 = "Este asistente organiza archivos en carpetas según su tipo.\nSelecciona una carpeta y presiona 'Organizar Archivos'."
 
 
 #------------------ LANGS ------------------
 msg_desacer_accion = "¡La última acción ha sido deshecha correctamente!"
+msg_deshacer_fallido = "No se ha podido deshacer la última acción: no se restauró ningún archivo."
 organizacion_exitosa = "¡Los archivos han sido organizados correctamente!"
 ultima_accion_vacia = "No hay ninguna acción para deshacer."
+msg_rehacer_accion = "¡La acción deshecha se ha vuelto a aplicar!"
+nada_que_rehacer = "No hay ninguna acción para rehacer."
+msg_duplicados = {"omitir": "{} archivos repetidos se han dejado donde estaban.",
+                  "enlazar": "{} archivos repetidos se han guardado como enlaces al original.",
+                  "clonar": "{} archivos repetidos se han guardado como clones del original.",
+                  "informar": "Se han encontrado {} archivos repetidos."}
+msg_duplicados_sin_enlace = "{} se han movido como copias porque el sistema de archivos no admite enlazarlos."
+msg_deduplicado = "{} archivos repetidos se han unificado con su original ({} liberados)."
+msg_deduplicado_fallos = "No se pudieron unificar {} archivos: {}"
+msg_deduplicado_cambiados = "{} archivos se han dejado como estaban porque cambiaron después de buscarlos."
+msg_rehacer_cambiados = "{} archivos repetidos no se han vuelto a enlazar porque cambiaron después de deshacer."
 
 
 # ------------------ HISTORIAL DE ACCIONES ------------------
 ultima_accion = []
+ultima_carpeta = None  # raíz de ultima_accion (en recursivo el primer archivo puede venir de una subcarpeta)
+# Resultado del último deshacer: renombrados son (ruta original, ruta final) y fallidos (ruta, error)
+InformeRestauracion = namedtuple("InformeRestauracion", ["restaurados", "renombrados", "fallidos"])
+ultimo_informe = None
+ultimos_duplicados = []  # (repetido, original) encontrados en la última organización
+
+# Diario en disco por carpeta: una línea JSON por registro, siempre añadidas al final. Cada lote de
+# movimientos se anota (y se hace fsync) antes de moverlo, así se puede deshacer después de cerrar la
+# aplicación o de un fallo a mitad de organizar. Al releerlo se reconstruyen las pilas de deshacer y
+# rehacer; solo se conservan las últimas niveles_historial organizaciones.
+usar_diario = True
+carpeta_diarios = Path.home() / ".folderwizard" / "diarios"
+niveles_historial = 10
+tamano_maximo_diario = 64 * 1024 * 1024  # a partir de aquí el diario se reescribe solo con el historial vivo
+
+
+class MovimientosCompactos:
+    # Movimientos (destino, origen) guardados como (id de carpeta, nombre) contra una tabla de carpetas
+    # internadas: cada ruta de carpeta se guarda una vez y no una vez por archivo. Los nombres van
+    # seguidos en un único bytearray (sin un objeto str por archivo) y el de destino solo se guarda
+    # aparte cuando no coincide con el de origen (p. ej. foto_copy1.jpg). Las entradas que dejaron un
+    # enlace o un clon del archivo idéntico (duplicados) llevan su Enlace en 'enlaces', por posición.
+    def __init__(self):
+        self.carpetas = []
+        self.enlaces = {}
+        self._ids = {}
+        self._origen = array("I")
+        self._destino = array("I")
+        self._nombres = bytearray()
+        self._posiciones = array("Q", [0])
+        self._nombres_destino = {}
+
+    def id_carpeta(self, ruta):
+        identificador = self._ids.get(ruta)
+        if identificador is None:
+            identificador = self._ids[ruta] = len(self.carpetas)
+            self.carpetas.append(ruta)
+        return identificador
+
+    def anadir(self, destino, origen, enlace=None):
+        carpeta_origen, nombre = os.path.split(origen)
+        carpeta_destino, nombre_destino = os.path.split(destino)
+        self.anadir_compacto(self.id_carpeta(carpeta_origen), nombre, self.id_carpeta(carpeta_destino),
+                             nombre_destino, enlace)
+
+    def anadir_compacto(self, carpeta_origen, nombre, carpeta_destino, nombre_destino=None, enlace=None):
+        if nombre_destino is not None and nombre_destino != nombre:
+            self._nombres_destino[len(self._origen)] = nombre_destino
+        if enlace is not None:
+            self.enlaces[len(self._origen)] = enlace
+        self._origen.append(carpeta_origen)
+        self._destino.append(carpeta_destino)
+        self._nombres += nombre.encode("utf-8", "surrogateescape")
+        self._posiciones.append(len(self._nombres))
+
+    def _nombre(self, i):
+        return self._nombres[self._posiciones[i]:self._posiciones[i + 1]].decode("utf-8", "surrogateescape")
+
+    def entradas(self):
+        # (id carpeta origen, nombre, id carpeta destino, nombre destino o None), tal como se guardan
+        for i in range(len(self._origen)):
+            yield self._origen[i], self._nombre(i), self._destino[i], self._nombres_destino.get(i)
+
+    def filtrar(self, quitar, renombrados):
+        # Nueva lista sin las posiciones de 'quitar' y con los nombres de destino de 'renombrados'
+        nuevos = MovimientosCompactos()
+        for i, (carpeta_origen, nombre, carpeta_destino, nombre_destino) in enumerate(self.entradas()):
+            if i not in quitar:
+                nuevos.anadir_compacto(nuevos.id_carpeta(self.carpetas[carpeta_origen]), nombre,
+                                       nuevos.id_carpeta(self.carpetas[carpeta_destino]),
+                                       renombrados.get(i, nombre_destino), self.enlaces.get(i))
+        return nuevos
+
+    def __len__(self):
+        return len(self._origen)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self._origen)
+        nombre = self._nombre(i)
+        return (os.path.join(self.carpetas[self._destino[i]], self._nombres_destino.get(i, nombre)),
+                os.path.join(self.carpetas[self._origen[i]], nombre))
+
+    def __iter__(self):
+        for i in range(len(self._origen)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in range(len(self._origen) - 1, -1, -1):
+            yield self[i]
+
+
+# pendientes: posiciones del último lote sin confirmar que no se llegaron a mover (comprobado en disco al
+# leer el diario), o None si todos los lotes están confirmados
+OperacionDiario = namedtuple("OperacionDiario", ["id", "carpeta", "fecha", "terminada", "movimientos", "pendientes"],
+                             defaults=(None,))
+# Cómo se deshace una entrada de duplicado: metodo "enlace" o "clon", el archivo idéntico que se conserva
+# y la fecha (ns) y permisos que tenía el repetido antes de sustituirlo
+Enlace = namedtuple("Enlace", ["metodo", "original", "mtime_ns", "modo"])
+
+
+class DiarioMovimientos:
+    def __init__(self, carpeta, ruta=None):
+        self.carpeta = os.path.abspath(os.fspath(carpeta))
+        if ruta is None:
+            ruta = DiarioMovimientos.ruta_para(self.carpeta)
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+        self.ruta = Path(ruta)
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._abrir()
+
+    @staticmethod
+    def ruta_para(carpeta):
+        carpeta = os.path.abspath(os.fspath(carpeta))
+        nombre = hashlib.sha1(carpeta.encode("utf-8", "surrogateescape")).hexdigest()
+        return carpeta_diarios / f"{nombre}.jsonl"
+
+    @staticmethod
+    def existe(carpeta):
+        return DiarioMovimientos.ruta_para(carpeta).exists()
+
+    def _abrir(self):
+        try:
+            with open(self.ruta, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                cortada = f.read(1) != b"\n"
+        except OSError:
+            cortada = False
+        self._f = open(self.ruta, "a", encoding="utf-8")
+        if cortada:
+            # La última línea quedó a medias: lo siguiente empieza en una línea nueva
+            self._f.write("\n")
+
+    def cerrar(self):
+        self._f.close()
+
+    def _escribir(self, *registros):
+        # Un único fsync para todos los registros, y cada registro cubre un lote entero
+        with self._lock:
+            for registro in registros:
+                self._f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def iniciar(self):
+        if self.ruta.stat().st_size > tamano_maximo_diario:
+            self.compactar()
+        operacion = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        self._ids = {}
+        self._escribir({"tipo": "inicio", "id": operacion, "carpeta": self.carpeta, "fecha": time.time()})
+        return operacion
+
+    def _id_carpeta(self, ruta, nuevas):
+        identificador = self._ids.get(ruta)
+        if identificador is None:
+            identificador = self._ids[ruta] = len(self._ids)
+            nuevas[identificador] = ruta
+        return identificador
+
+    def anotar_lote(self, operacion, movimientos, enlaces=None):
+        # movimientos: (origen, destino) que se van a hacer a continuación. Las carpetas nuevas viajan
+        # en el mismo registro que los movimientos que las usan. enlaces: {posición: Enlace}.
+        nuevas = {}
+        entradas = []
+        for origen, destino in movimientos:
+            carpeta_origen, nombre = os.path.split(origen)
+            carpeta_destino, nombre_destino = os.path.split(destino)
+            entrada = [self._id_carpeta(carpeta_origen, nuevas), nombre, self._id_carpeta(carpeta_destino, nuevas)]
+            if nombre_destino != nombre:
+                entrada.append(nombre_destino)
+            entradas.append(entrada)
+        registro = {"tipo": "lote", "id": operacion, "carpetas": nuevas, "movimientos": entradas}
+        if enlaces:
+            registro["enlaces"] = [[i, *enlace] for i, enlace in enlaces.items()]
+        self._escribir(registro)
+
+    def confirmar_lote(self, operacion, fallidos, renombrados):
+        # Solo lo que no salió como se anotó, por posición dentro del lote: los que no se movieron
+        # y los que acabaron con otro nombre
+        self._escribir({"tipo": "hecho", "id": operacion, "fallidos": fallidos, "renombrados": renombrados})
+
+    def terminar(self, operacion):
+        self._escribir({"tipo": "fin", "id": operacion})
+
+    def marcar_deshecha(self, operacion):
+        self._escribir({"tipo": "deshecha", "id": operacion})
+
+    def rehacer(self, operacion):
+        # La operación vuelve a deshacer sin movimientos: los lotes que se anoten a continuación la
+        # rellenan con lo que se vuelva a mover, igual que al organizar
+        self._ids = {}
+        self._escribir({"tipo": "rehaciendo", "id": operacion})
+
+    def _registros(self):
+        with self._lock:
+            self._f.flush()
+        with open(self.ruta, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                    registro["tipo"], registro["id"]
+                except (ValueError, KeyError, TypeError):
+                    # Línea cortada por un fallo mientras se escribía
+                    continue
+                yield registro
+
+    def historial(self):
+        # Devuelve (deshacer, rehacer): listas de OperacionDiario con la siguiente a aplicar al final.
+        # De un lote anotado pero sin confirmar se da por movido lo que ya está en el destino.
+        operaciones = {}
+        deshacer = []
+        rehacer = []
+        for registro in self._registros():
+            tipo, operacion = registro["tipo"], registro["id"]
+            if tipo == "inicio":
+                operaciones[operacion] = {"carpeta": registro.get("carpeta"), "fecha": registro.get("fecha"),
+                                          "terminada": False, "movimientos": MovimientosCompactos(),
+                                          "ids": {}, "lote": None}
+                if registro.get("rehacer"):
+                    # Viene de la pila de rehacer de un diario compactado: no ocupa un nivel de deshacer
+                    rehacer.append(operacion)
+                    continue
+                if not registro.get("historial"):
+                    # Una organización nueva invalida lo que se podía rehacer
+                    for antigua in rehacer:
+                        operaciones.pop(antigua, None)
+                    rehacer = []
+                deshacer.append(operacion)
+                if len(deshacer) > niveles_historial:
+                    operaciones.pop(deshacer.pop(0), None)
+                continue
+            datos = operaciones.get(operacion)
+            if datos is None:
+                continue
+            if tipo == "lote":
+                movimientos = datos["movimientos"]
+                for clave, ruta in registro.get("carpetas", {}).items():
+                    datos["ids"][int(clave)] = movimientos.id_carpeta(ruta)
+                datos["lote"] = registro["movimientos"]
+                datos["enlaces"] = {entrada[0]: Enlace(*entrada[1:]) for entrada in registro.get("enlaces", ())}
+            elif tipo == "hecho" and datos["lote"] is not None:
+                self._aplicar_lote(datos, set(registro["fallidos"]), dict(registro["renombrados"]))
+            elif tipo == "fin":
+                datos["terminada"] = True
+            elif tipo == "deshecha" and operacion in deshacer:
+                deshacer.remove(operacion)
+                rehacer.append(operacion)
+            elif tipo == "rehaciendo" and operacion in rehacer:
+                datos.update(terminada=False, movimientos=MovimientosCompactos(), ids={}, lote=None)
+                rehacer.remove(operacion)
+                deshacer.append(operacion)
+            elif tipo == "rehecha" and operacion in rehacer:
+                # Diarios anteriores a rehacer por lotes: un único registro al final con lo que falló
+                datos["movimientos"] = datos["movimientos"].filtrar(
+                    set(registro["fallidos"]), {i: nombre for i, nombre in registro["renombrados"]})
+                rehacer.remove(operacion)
+                deshacer.append(operacion)
+
+        def operacion_diario(operacion):
+            datos = operaciones[operacion]
+            pendientes = self._aplicar_lote(datos, None, {}) if datos["lote"] is not None else None
+            return OperacionDiario(operacion, datos["carpeta"], datos["fecha"], datos["terminada"],
+                                   datos["movimientos"], pendientes)
+
+        # Una operación sin movimientos (nada que mover, o todo falló) no tiene nada que deshacer ni rehacer
+        deshacer = [operacion for operacion in map(operacion_diario, deshacer) if len(operacion.movimientos)]
+        rehacer = [operacion for operacion in map(operacion_diario, rehacer) if len(operacion.movimientos)]
+        return deshacer, rehacer
+
+    @staticmethod
+    def _aplicar_lote(datos, fallidos, renombrados):
+        # fallidos None: lote sin confirmar, se comprueba en disco qué se llegó a mover
+        # (las sustituciones en el sitio se dan por hechas: separarlas de nuevo no cambia el contenido).
+        # Devuelve las posiciones del lote que se dieron por no movidas.
+        movimientos = datos["movimientos"]
+        sin_mover = []
+        ids = datos["ids"]
+        enlaces = datos.get("enlaces", {})
+        for i, entrada in enumerate(datos["lote"]):
+            carpeta_origen, nombre, carpeta_destino = ids[entrada[0]], entrada[1], ids[entrada[2]]
+            nombre_destino = renombrados.get(i, entrada[3] if len(entrada) > 3 else nombre)
+            if fallidos is None:
+                destino = os.path.join(movimientos.carpetas[carpeta_destino], nombre_destino)
+                origen = os.path.join(movimientos.carpetas[carpeta_origen], nombre)
+                if destino != origen and (not os.path.lexists(destino) or os.path.lexists(origen)):
+                    sin_mover.append(i)
+                    continue
+            elif i in fallidos:
+                continue
+            movimientos.anadir_compacto(carpeta_origen, nombre, carpeta_destino, nombre_destino, enlaces.get(i))
+        datos["lote"] = None
+        return sin_mover
+
+    @staticmethod
+    def _registros_lote(operacion, carpetas, entradas, enlaces):
+        lote = {"tipo": "lote", "id": operacion, "carpetas": carpetas, "movimientos": entradas}
+        if enlaces:
+            lote["enlaces"] = enlaces
+        return lote, {"tipo": "hecho", "id": operacion, "fallidos": [], "renombrados": []}
+
+    def compactar(self):
+        # Reescribe el diario solo con las operaciones que siguen en el historial, en un temporal que
+        # después sustituye al original
+        deshacer, rehacer = self.historial()
+        temporal = self.ruta.with_name(self.ruta.name + ".tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            for operacion, deshecha in [(op, False) for op in deshacer] + [(op, True) for op in rehacer]:
+                registros = [{"tipo": "inicio", "id": operacion.id, "carpeta": operacion.carpeta,
+                              "fecha": operacion.fecha, "historial": True, "rehacer": deshecha}]
+                movimientos = operacion.movimientos
+                carpetas = dict(enumerate(movimientos.carpetas))
+                entradas, enlaces = [], []
+                for i, (carpeta_origen, nombre, carpeta_destino, nombre_destino) in enumerate(movimientos.entradas()):
+                    entrada = [carpeta_origen, nombre, carpeta_destino]
+                    if nombre_destino is not None:
+                        entrada.append(nombre_destino)
+                    if i in movimientos.enlaces:
+                        enlaces.append([len(entradas), *movimientos.enlaces[i]])
+                    entradas.append(entrada)
+                    if len(entradas) == tamano_lote:
+                        registros.extend(self._registros_lote(operacion.id, carpetas, entradas, enlaces))
+                        carpetas, entradas, enlaces = {}, [], []
+                if entradas:
+                    registros.extend(self._registros_lote(operacion.id, carpetas, entradas, enlaces))
+                if operacion.terminada:
+                    registros.append({"tipo": "fin", "id": operacion.id})
+                for registro in registros:
+                    f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self._f.close()
+            os.replace(temporal, self.ruta)
+            self._abrir()
+
+
+def abrir_diario(carpeta):
+    if not usar_diario:
+        return None
+    try:
+        return DiarioMovimientos(carpeta)
+    except OSError:
+        return None
+
+
+def operacion_interrumpida(carpeta):
+    # Organización que se cortó a mitad (cierre o fallo) y no se ha deshecho, o None
+    if not usar_diario or not DiarioMovimientos.existe(carpeta):
+        return None
+    diario = abrir_diario(carpeta)
+    if diario is None:
+        return None
+    try:
+        deshacer, _ = diario.historial()
+    finally:
+        diario.cerrar()
+    if deshacer and not deshacer[-1].terminada and len(deshacer[-1].movimientos):
+        return deshacer[-1]
+    return None
 
 
 # ------------------ FUNCIONES AUXILIARES ------------------
-def mover_archivo(origen, destino):
-    counter = 1
-    dest_path = Path(destino)
-    while dest_path.exists():
-        dest_path = Path(f"{destino.stem}_copy{counter}{destino.suffix}")
-        counter += 1
-    shutil.move(str(origen), str(dest_path))
+def _copiar_bloques(fd_origen, fd_destino, tamano):
+    # Copia dentro del kernel (copy_file_range y, si no se puede, sendfile) sin pasar por buffers de Python
+    copiado = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copiado < tamano:
+                n = os.copy_file_range(fd_origen, fd_destino, min(tamano_bloque_copia, tamano - copiado),
+                                       copiado, copiado)
+                if n == 0:
+                    break
+                copiado += n
+            return copiado
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+                raise
+    if hasattr(os, "sendfile"):
+        try:
+            os.lseek(fd_destino, copiado, os.SEEK_SET)
+            while copiado < tamano:
+                n = os.sendfile(fd_destino, fd_origen, copiado, min(tamano_bloque_copia, tamano - copiado))
+                if n == 0:
+                    break
+                copiado += n
+            return copiado
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    os.lseek(fd_origen, copiado, os.SEEK_SET)
+    os.lseek(fd_destino, copiado, os.SEEK_SET)
+    while True:
+        bloque = os.read(fd_origen, tamano_bloque_copia)
+        if not bloque:
+            return copiado
+        os.write(fd_destino, bloque)
+        copiado += len(bloque)
+
+
+def _mover_entre_dispositivos(origen, destino):
+    if os.path.islink(origen) or not os.path.isfile(origen):
+        shutil.move(origen, destino)
+        return
+    tamano = os.stat(origen).st_size
+    with open(origen, "rb") as fuente, open(destino, "xb") as copia:
+        try:
+            _copiar_bloques(fuente.fileno(), copia.fileno(), tamano)
+            copia.flush()
+            if os.fstat(copia.fileno()).st_size != tamano:
+                raise OSError(errno.EIO, f"La copia de '{origen}' está incompleta.", destino)
+        except BaseException:
+            copia.close()
+            os.unlink(destino)
+            raise
+    shutil.copystat(origen, destino)
+    os.unlink(origen)
+
+
+def _mover(origen, destino, dispositivos=None):
+    # 'dispositivos' guarda, por pareja de carpetas, si comparten sistema de archivos (st_dev),
+    # para comprobarlo una sola vez por destino.
+    if dispositivos is None:
+        dispositivos = {}
+    carpetas = (os.path.dirname(origen), os.path.dirname(destino))
+    mismo_dispositivo = dispositivos.get(carpetas)
+    if mismo_dispositivo is None:
+        mismo_dispositivo = os.stat(carpetas[0]).st_dev == os.stat(carpetas[1]).st_dev
+        dispositivos[carpetas] = mismo_dispositivo
+    if mismo_dispositivo:
+        try:
+            os.rename(origen, destino)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            dispositivos[carpetas] = False
+    _mover_entre_dispositivos(origen, destino)
+
+
+class NombresOcupados:
+    # Nombres de cada carpeta de destino, leídos una sola vez. Guarda también el siguiente
+    # contador _copyN por nombre, así resolver una colisión no necesita consultar el disco.
+    def __init__(self):
+        self._carpetas = {}
+        self._lock = threading.Lock()
+
+    def _cargar(self, carpeta):
+        datos = self._carpetas.get(carpeta)
+        if datos is None:
+            try:
+                nombres = {os.path.normcase(nombre) for nombre in os.listdir(carpeta)}
+            except FileNotFoundError:
+                nombres = set()
+            datos = self._carpetas[carpeta] = (nombres, {})
+        return datos
+
+    def reservar(self, destino):
+        destino = Path(destino)
+        with self._lock:
+            nombres, contadores = self._cargar(os.fspath(destino.parent))
+            nombre = destino.name
+            clave = os.path.normcase(nombre)
+            if clave in nombres:
+                counter = contadores.get(clave, 1)
+                while os.path.normcase(f"{destino.stem}_copy{counter}{destino.suffix}") in nombres:
+                    counter += 1
+                contadores[clave] = counter + 1
+                nombre = f"{destino.stem}_copy{counter}{destino.suffix}"
+            nombres.add(os.path.normcase(nombre))
+        return destino.parent / nombre
+
+
+def mover_archivo(origen, destino, dispositivos=None, nombres=None):
+    destino = Path(destino)
+    if nombres is not None:
+        dest_path = nombres.reservar(destino)
+    else:
+        counter = 1
+        dest_path = destino
+        while dest_path.exists():
+            dest_path = destino.parent / f"{destino.stem}_copy{counter}{destino.suffix}"
+            counter += 1
+    _mover(os.path.abspath(origen), os.path.abspath(dest_path), dispositivos)
     return dest_path
 
 
-def obtener_archivos_recientes(folder_path, dias=7):
-    folder = Path(folder_path)
-    limite_fecha = datetime.now() - timedelta(days=dias)
-    return [f.name for f in folder.iterdir() if f.is_file() and datetime.fromtimestamp(f.stat().st_mtime) > limite_fecha]
+ArchivoReciente = namedtuple("ArchivoReciente", ["ruta", "tamano", "mtime"])
 
 
-def organizar_carpeta(folder_path):
-    global ultima_accion
-    folder = Path(folder_path)
+def buscar_recientes(folder_path, desde=None, hasta=None, recursivo=False, limite=None, pagina=0, indice=None,
+                     exclusiones=None):
+    # Archivos con desde < mtime <= hasta (segundos, comparados tal cual con st_mtime), del más nuevo al
+    # más antiguo. Con 'limite' se devuelve solo la página 'pagina' de ese tamaño. Con índice lo resuelve
+    # SQLite recorriendo su índice de mtime; sin él, un montículo de limite * (pagina + 1) elementos, así
+    # que nunca se guarda la lista de toda la carpeta.
+    # Ojo: editar un archivo no cambia el mtime de su carpeta, así que IndiceCarpeta.actualizar no lo ve.
+    # Solo hay que pasar 'indice' si un VigilanteCarpeta con inotify lo mantiene al día (vigilante.al_dia).
+    if not os.path.isdir(folder_path):
+        raise FileNotFoundError(f"La carpeta '{folder_path}' no existe.")
+    saltar = limite * pagina if limite is not None else 0
+    if indice is not None:
+        return [ArchivoReciente(os.path.join(indice.carpeta, ruta), tamano, mtime)
+                for ruta, tamano, mtime in indice.recientes(desde, hasta, recursivo, limite, saltar)]
+
+    candidatos = ((ruta, tamano, mtime) for ruta, _, tamano, mtime in
+                  _recorrer_archivos(folder_path, exclusiones=exclusiones, recursivo=recursivo)
+                  if (desde is None or mtime > desde) and (hasta is None or mtime <= hasta))
+    if limite is None:
+        ordenados = sorted(candidatos, key=lambda archivo: archivo[2], reverse=True)
+    else:
+        ordenados = heapq.nlargest(saltar + limite, candidatos, key=lambda archivo: archivo[2])[saltar:]
+    return [ArchivoReciente(*archivo) for archivo in ordenados]
+
+
+def obtener_archivos_recientes(folder_path, dias=7, indice=None):
+    # Se mantiene por compatibilidad: nombres de la carpeta (sin subcarpetas) modificados en los últimos días
+    desde = time.time() - dias * 24 * 3600
+    return [os.path.basename(archivo.ruta) for archivo in buscar_recientes(folder_path, desde, indice=indice)]
+
+
+def mover_en_paralelo(movimientos, hilos=hilos_movimiento, nombres=None, dispositivos=None, repartir=False):
+    # Cada carpeta de destino se procesa en orden y por un único hilo, así la resolución de
+    # colisiones de mover_archivo nunca compite consigo misma. Con repartir=True (casi todo va a la
+    # misma carpeta, como al deshacer) se reparte en tramos seguidos entre los hilos: NombresOcupados
+    # reserva los nombres con su lock, solo se pierde el orden de los sufijos _copyN.
+    # Devuelve (completados, errores): los completados en el mismo orden que 'movimientos' y los
+    # errores en el orden de los movimientos que fallaron.
+    resultados = [None] * len(movimientos)
+    errores = []
+    grupos = {}
+    dispositivos = {} if dispositivos is None else dispositivos
+    nombres = NombresOcupados() if nombres is None else nombres
+    if repartir:
+        tramo = max(1, -(-len(movimientos) // max(hilos, 1)))
+        for inicio in range(0, len(movimientos), tramo):
+            grupos[inicio] = range(inicio, min(inicio + tramo, len(movimientos)))
+    else:
+        for posicion, (origen, destino) in enumerate(movimientos):
+            grupos.setdefault(Path(destino).parent, []).append(posicion)
+
+    def procesar(posiciones):
+        for posicion in posiciones:
+            origen, destino = movimientos[posicion]
+            try:
+                resultados[posicion] = (str(mover_archivo(origen, destino, dispositivos, nombres)), str(origen))
+            except OSError as e:
+                errores.append((posicion, e))
+
+    if hilos <= 1 or len(grupos) <= 1:
+        for posiciones in grupos.values():
+            procesar(posiciones)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            list(pool.map(procesar, grupos.values()))
+
+    errores.sort(key=lambda error: error[0])
+    return [r for r in resultados if r is not None], [e for _, e in errores]
+
+
+# ------------------ DUPLICADOS ------------------
+# enlazar guarda el repetido como enlace duro del original y clonar como copia por referencia (reflink)
+MODOS_DUPLICADOS = ("copiar", "omitir", "enlazar", "clonar", "informar")
+modo_duplicados = "copiar"  # copiar = como siempre, el repetido se guarda como _copyN
+METODOS_ENLACE = ("enlace", "clon")
+metodo_deduplicado = "enlace"  # cómo deduplicar_carpeta sustituye las copias repetidas
+FICLONE = 0x40049409  # ioctl de Linux (Btrfs, XFS...) que comparte los bloques de otro archivo
+muestra_duplicados = 64 * 1024  # bytes del principio y del final que se comparan antes de leer todo
+hilos_hash = 4  # hilos para calcular hashes (hashlib suelta el GIL con bloques grandes)
+# fechas: mtime de cada ruta al recorrer la carpeta, para saber si alguna cambió después de compararlas
+GrupoDuplicados = namedtuple("GrupoDuplicados", ["tamano", "rutas", "fechas"])
+# Errores de os.link y FICLONE que solo significan que el sistema de archivos no admite el enlace o el clon
+_SIN_ENLACE = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY)
+
+
+def _hash_parcial(ruta, tamano):
+    resumen = hashlib.blake2b(digest_size=16)
+    with open(ruta, "rb") as f:
+        resumen.update(f.read(muestra_duplicados))
+        if tamano > 2 * muestra_duplicados:
+            f.seek(-muestra_duplicados, os.SEEK_END)
+        resumen.update(f.read(muestra_duplicados))
+    return resumen.digest()
+
+
+def _calcular_huellas(huellas, campo, hilos=hilos_hash):
+    # Una huella es [ruta, tamano, hash parcial, hash completo]; rellena 'campo' (2 o 3). Si no se puede
+    # leer se deja False para no volver a intentarlo y para que nunca coincida con otra.
+    def calcular(huella):
+        try:
+            huella[campo] = _hash_parcial(huella[0], huella[1]) if campo == 2 else _hash_archivo(huella[0])
+        except OSError:
+            huella[campo] = False
+
+    if hilos <= 1 or len(huellas) <= 1:
+        for huella in huellas:
+            calcular(huella)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(hilos, len(huellas))) as pool:
+            list(pool.map(calcular, huellas))
+
+
+def _necesita_completo(tamano):
+    # Hasta 128 KB la muestra ya es el archivo entero
+    return tamano > 2 * muestra_duplicados
+
+
+def _grupos_iguales(huellas, hilos=hilos_hash):
+    # Huellas del mismo tamaño -> listas de las que tienen el mismo contenido. Primero se compara la
+    # muestra y solo las que coinciden se leen enteras.
+    _calcular_huellas([huella for huella in huellas if huella[2] is None], 2, hilos)
+    por_muestra = {}
+    for huella in huellas:
+        if huella[2]:
+            por_muestra.setdefault(huella[2], []).append(huella)
+    grupos = [grupo for grupo in por_muestra.values() if len(grupo) > 1]
+    if not grupos or not _necesita_completo(huellas[0][1]):
+        return grupos
+    _calcular_huellas([huella for grupo in grupos for huella in grupo if huella[3] is None], 3, hilos)
+    completos = {}
+    for huella in itertools.chain.from_iterable(grupos):
+        if huella[3]:
+            completos.setdefault(huella[3], []).append(huella)
+    return [grupo for grupo in completos.values() if len(grupo) > 1]
+
+
+def buscar_duplicados(carpeta, hilos=hilos_hash, exclusiones=None):
+    # Agrupa por tamaño con los metadatos del recorrido: un archivo con tamaño único no se abre nunca.
+    # Devuelve GrupoDuplicados ordenados por el espacio que se recuperaría.
+    por_tamano = {}
+    for ruta, _, tamano, mtime in _recorrer_archivos(carpeta, exclusiones=exclusiones):
+        if tamano:
+            por_tamano.setdefault(tamano, []).append((ruta, mtime))
+    grupos = []
+    for tamano, archivos in por_tamano.items():
+        if len(archivos) > 1:
+            fechas = dict(archivos)
+            for grupo in _grupos_iguales([[ruta, tamano, None, None] for ruta, _ in archivos], hilos):
+                rutas = sorted(huella[0] for huella in grupo)
+                grupos.append(GrupoDuplicados(tamano, rutas, [fechas[ruta] for ruta in rutas]))
+    grupos.sort(key=lambda grupo: grupo.tamano * (len(grupo.rutas) - 1), reverse=True)
+    return grupos
+
+
+class DetectorDuplicados:
+    # Para organizar_carpeta: recuerda, por carpeta de destino, las huellas de lo que ya hay y de lo que va
+    # llegando, agrupadas por tamaño. Solo se leen los archivos que comparten tamaño con otro del mismo destino.
+    def __init__(self, modo=modo_duplicados, hilos=hilos_hash):
+        if modo not in MODOS_DUPLICADOS:
+            raise ValueError(f"Modo de duplicados desconocido: {modo}")
+        self.modo = modo
+        self.hilos = hilos
+        self.encontrados = []  # (ruta del repetido, ruta del archivo idéntico que se conserva)
+        self.sin_enlace = 0  # repetidos que se movieron sin más porque el sistema no admite enlazarlos
+        self._carpetas = {}
+
+    def _por_tamano(self, carpeta):
+        tamanos = self._carpetas.get(carpeta)
+        if tamanos is None:
+            tamanos = self._carpetas[carpeta] = {}
+            try:
+                with os.scandir(carpeta) as entradas:
+                    for entrada in entradas:
+                        try:
+                            if entrada.is_file(follow_symlinks=False):
+                                tamano = entrada.stat().st_size
+                                tamanos.setdefault(tamano, []).append([entrada.path, tamano, None, None])
+                        except OSError:
+                            continue
+            except FileNotFoundError:
+                pass
+        return tamanos
+
+    def buscar(self, bloque):
+        # Devuelve, alineado con 'bloque', la ruta del archivo idéntico en el destino o None. Los repetidos
+        # del propio lote cuentan: el segundo de dos iguales es duplicado del primero.
+        huellas = [[movimiento.origen, movimiento.tamano, None, None] for movimiento in bloque]
+        grupos = {}
+        for i, movimiento in enumerate(bloque):
+            if movimiento.tamano:
+                grupos.setdefault((os.path.dirname(movimiento.destino), movimiento.tamano), []).append(i)
+        for (carpeta, tamano), posiciones in grupos.items():
+            previas = self._por_tamano(carpeta).get(tamano, [])
+            if len(posiciones) + len(previas) > 1:
+                _grupos_iguales([huellas[i] for i in posiciones] + previas, self.hilos)
+
+        originales = []
+        for movimiento, huella in zip(bloque, huellas):
+            original = None
+            iguales = self._por_tamano(os.path.dirname(movimiento.destino)).setdefault(movimiento.tamano, [])
+            if huella[2] and movimiento.tamano:
+                completo = _necesita_completo(movimiento.tamano)
+                for otra in iguales:
+                    if otra[2] == huella[2] and (not completo or (huella[3] and otra[3] == huella[3])):
+                        original = otra[0]
+                        break
+            if original is None:
+                # A partir de aquí se lee desde su destino: el lote se mueve antes del siguiente
+                huella[0] = movimiento.destino
+                iguales.append(huella)
+            else:
+                self.encontrados.append((movimiento.origen, original))
+            originales.append(original)
+        return originales
+
+
+def _clonar(original, destino):
+    # El clon es un archivo independiente que comparte los bloques del original hasta que se modifica
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, "Este sistema no admite clonar archivos", destino)
+    with open(original, "rb") as fuente, open(destino, "xb") as copia:
+        try:
+            fcntl.ioctl(copia.fileno(), FICLONE, fuente.fileno())
+        except OSError:
+            copia.close()
+            os.unlink(destino)
+            raise
+    shutil.copystat(original, destino)
+
+
+def _crear_enlace(metodo, original, destino):
+    if metodo == "clon":
+        _clonar(original, destino)
+    else:
+        os.link(original, destino)
+
+
+def _temporal_junto_a(ruta):
+    # Oculto y en la misma carpeta, para que os.replace sea atómico y organizar no lo vea si queda a medias
+    carpeta, nombre = os.path.split(ruta)
+    return os.path.join(carpeta, f".{nombre}.fw-tmp")
+
+
+def _sustituir_por_enlace(metodo, original, ruta):
+    # La ruta sigue existiendo en todo momento: el enlace se crea aparte y sustituye al archivo de golpe
+    temporal = _temporal_junto_a(ruta)
+    _crear_enlace(metodo, original, temporal)
+    try:
+        os.replace(temporal, ruta)
+    except OSError:
+        os.unlink(temporal)
+        raise
+
+
+def _separar_enlace(ruta, enlace):
+    # Deshace la sustitución sin mover la ruta: un enlace duro se convierte en una copia propia (solo si
+    # sigue compartido) y se recuperan la fecha y los permisos que tenía el archivo repetido
+    if enlace.metodo == "enlace" and os.stat(ruta).st_nlink > 1:
+        temporal = _temporal_junto_a(ruta)
+        shutil.copyfile(ruta, temporal)
+        try:
+            os.replace(temporal, ruta)
+        except OSError:
+            os.unlink(temporal)
+            raise
+    os.chmod(ruta, enlace.modo)
+    os.utime(ruta, ns=(enlace.mtime_ns, enlace.mtime_ns))
+
+
+def _enlace_para(metodo, original, ruta):
+    info = os.stat(ruta)
+    return Enlace(metodo, os.fspath(original), info.st_mtime_ns, info.st_mode & 0o7777)
+
+
+def _cambiado_desde(ruta, tamano, mtime):
+    # Los hashes se calcularon con el archivo como estaba entonces: si el tamaño o la fecha no coinciden
+    # ya no se sabe si sigue siendo igual a su original
+    info = os.stat(ruta)
+    return info.st_size != tamano or info.st_mtime != mtime
+
+
+def _sigue_igual(ruta, enlace):
+    # Deshacer devuelve al repetido la fecha que tenía (_separar_enlace): si es otra, se ha editado después.
+    # No se mira el original porque al rehacer puede no haber llegado aún a su sitio.
+    return os.stat(ruta).st_mtime_ns == enlace.mtime_ns
+
+
+def enlazar_duplicado(original, origen, destino, nombres=None, dispositivos=None, metodo="enlace"):
+    # El repetido pasa a ser otro nombre (enlace duro) o un clon del archivo idéntico: el contenido ocupa
+    # el disco una sola vez. Si el sistema de archivos no lo admite se mueve como siempre.
+    # Devuelve (ruta final, si se llegó a enlazar).
+    dest_path = nombres.reservar(destino) if nombres is not None else Path(destino)
+    try:
+        _crear_enlace(metodo, original, dest_path)
+    except OSError as e:
+        if e.errno not in _SIN_ENLACE:
+            raise
+        _mover(os.path.abspath(origen), os.path.abspath(dest_path), dispositivos)
+        return dest_path, False
+    try:
+        os.unlink(origen)
+    except OSError:
+        os.unlink(dest_path)
+        raise
+    return dest_path, True
+
+
+def deduplicar_carpeta(carpeta, metodo=metodo_deduplicado, hilos=hilos_hash, exclusiones=None):
+    # Sustituye cada copia repetida por un enlace duro o un clon del primer archivo de su grupo sin mover
+    # ninguna ruta. Se anota en el diario como una organización más, así que se puede deshacer y rehacer.
+    global ultima_accion, ultima_carpeta
+    if metodo not in METODOS_ENLACE:
+        raise ValueError(f"Método de deduplicado desconocido: {metodo}")
+    carpeta = os.path.abspath(carpeta)  # rutas absolutas en el diario, como al organizar
+    grupos = buscar_duplicados(carpeta, hilos, exclusiones)
+    pendientes = ((grupo.tamano, grupo.rutas[0], grupo.fechas[0], ruta, fecha)
+                  for grupo in grupos for ruta, fecha in zip(grupo.rutas[1:], grupo.fechas[1:]))
+    completados, errores = MovimientosCompactos(), []
+    liberado = 0
+    cambiados = 0
+    diario = abrir_diario(carpeta)
+    operacion = None
+    try:
+        while True:
+            bloque = list(itertools.islice(pendientes, tamano_lote))
+            if not bloque:
+                break
+            pares, enlaces, comprobar = [], {}, []
+            for tamano, original, fecha_original, ruta, fecha in bloque:
+                try:
+                    if os.path.samefile(original, ruta):
+                        continue  # ya es el mismo archivo
+                    enlaces[len(pares)] = _enlace_para(metodo, original, ruta)
+                except OSError as e:
+                    errores.append(e)
+                    continue
+                pares.append((ruta, ruta))
+                comprobar.append((tamano, fecha_original, fecha))
+            if diario is not None and pares:
+                if operacion is None:
+                    # Solo se abre una operación en el historial si hay algo que sustituir
+                    operacion = diario.iniciar()
+                diario.anotar_lote(operacion, pares, enlaces)
+            hechos = []
+            for i, (ruta, _) in enumerate(pares):
+                tamano, fecha_original, fecha = comprobar[i]
+                try:
+                    # Justo antes de sustituir: lo editado desde la búsqueda no se toca
+                    if _cambiado_desde(ruta, tamano, fecha) or \
+                            _cambiado_desde(enlaces[i].original, tamano, fecha_original):
+                        cambiados += 1
+                        continue
+                    _sustituir_por_enlace(metodo, enlaces[i].original, ruta)
+                except OSError as e:
+                    errores.append(e)
+                    continue
+                hechos.append((ruta, ruta))
+                completados.anadir(ruta, ruta, enlaces[i])
+                liberado += tamano
+            if diario is not None and pares:
+                diario.confirmar_lote(operacion, *_diferencias_lote(pares, hechos))
+        if operacion is not None:
+            diario.terminar(operacion)
+    finally:
+        if diario is not None:
+            diario.cerrar()
+    ultima_accion, ultima_carpeta = completados, carpeta
+    if errores and not completados:
+        raise errores[0]
+    mensaje = msg_deduplicado.format(len(completados), formatear_tamano(liberado))
+    if cambiados:
+        mensaje += "\n" + msg_deduplicado_cambiados.format(cambiados)
+    if errores:
+        mensaje += "\n" + msg_deduplicado_fallos.format(len(errores), errores[0])
+    return mensaje
+
+
+# ------------------ PLAN DE ORGANIZACIÓN ------------------
+Movimiento = namedtuple("Movimiento", ["origen", "destino", "categoria", "tamano", "nombre"])
+
+
+def _es_organizable(nombre):
+    return not nombre.startswith('.') and nombre.lower() != "desktop.ini"
+
+
+def planificar_organizacion(folder_path, clasificador=None, indice=None, exclusiones=None):
+    # Calcula todos los movimientos sin tocar el disco: un único os.scandir de la carpeta y un listado
+    # de cada carpeta de categoría ya existente para resolver los nombres repetidos.
+    # Las rutas del plan son absolutas: el diario se puede releer después desde cualquier directorio.
+    folder = Path(os.path.abspath(folder_path))
     if not folder.exists():
         raise FileNotFoundError(f"La carpeta '{folder_path}' no existe.")
-
-    movimientos = []
-    for category in CATEGORIES:
-        (folder / category).mkdir(exist_ok=True)
-
-    for file in folder.iterdir():
-        if not file.is_file() or file.name.startswith('.') or file.name.lower() == "desktop.ini":
+    clasificador = clasificador or CLASIFICADOR
+    exclusiones = EXCLUSIONES if exclusiones is None else exclusiones
+    nombres = NombresOcupados()
+
+    # El índice ya filtró con sus propias reglas: si son otras, le faltarían archivos que scandir sí vería
+    if indice is not None and indice.exclusiones.huella == exclusiones.huella:
+        indice.actualizar(recursivo=False)
+        archivos = [(os.path.basename(ruta), tamano) for ruta, tamano, _, _ in indice.archivos()]
+    else:
+        archivos = []
+        with os.scandir(folder) as entradas:
+            for entrada in entradas:
+                try:
+                    if entrada.is_file():
+                        archivos.append((entrada.name, entrada.stat().st_size))
+                except OSError:
+                    continue
+
+    plan = []
+    for nombre, tamano in archivos:
+        if not _es_organizable(nombre) or exclusiones.excluye(nombre):
             continue
-        moved = False
-        for category, extensions in CATEGORIES.items():
-            if file.suffix.lower() in extensions:
-                destino = mover_archivo(file, folder / category / file.name)
-                movimientos.append((str(destino), str(file)))
-                moved = True
-                break
-        if not moved:
-            destino = mover_archivo(file, folder / 'Otros' / file.name)
-            movimientos.append((str(destino), str(file)))
-
-    ultima_accion = movimientos
+        categoria = clasificador.categoria(nombre)
+        destino = nombres.reservar(folder / categoria / nombre)
+        plan.append(Movimiento(str(folder / nombre), str(destino), categoria, tamano, destino.name))
+    return tuple(plan)
+
+
+def recorrer_organizables(folder_path, clasificador=None, exclusiones=None, nombres=None):
+    # Versión recursiva de planificar_organizacion: generador de Movimiento para los archivos de la carpeta
+    # y de todas sus subcarpetas (salvo las de categoría de la raíz, las ocultas y las excluidas). No se
+    # guarda la lista del árbol, pero nombres sí acumula un nombre por archivo (todos acaban en las mismas
+    # carpetas de categoría). Se puede ir moviendo mientras se recorre: sacar archivos de una carpeta
+    # mientras se lista no hace que scandir se salte ninguno.
+    folder = Path(os.path.abspath(folder_path))
+    if not folder.exists():
+        raise FileNotFoundError(f"La carpeta '{folder_path}' no existe.")
+    clasificador = clasificador or CLASIFICADOR
+    exclusiones = EXCLUSIONES if exclusiones is None else exclusiones
+    nombres = NombresOcupados() if nombres is None else nombres
+    categorias = {os.path.normcase(categoria) for categoria in clasificador.categorias}
+
+    pendientes = [(os.fspath(folder), "")]
+    while pendientes:
+        ruta, prefijo = pendientes.pop()
+        try:
+            entradas = os.scandir(ruta)
+        except OSError:
+            continue
+        with entradas:
+            for entrada in entradas:
+                if not _es_organizable(entrada.name):
+                    continue
+                relativa = prefijo + entrada.name
+                try:
+                    if entrada.is_dir(follow_symlinks=False):
+                        if (prefijo or os.path.normcase(entrada.name) not in categorias) and \
+                                not exclusiones.excluye(relativa, carpeta=True):
+                            pendientes.append((entrada.path, relativa + "/"))
+                        continue
+                    if not entrada.is_file() or exclusiones.excluye(relativa):
+                        continue
+                    tamano = entrada.stat().st_size
+                except OSError:
+                    continue
+                categoria = clasificador.categoria(entrada.name)
+                destino = nombres.reservar(folder / categoria / entrada.name)
+                yield Movimiento(entrada.path, str(destino), categoria, tamano, destino.name)
+
+
+def _diferencias_lote(pares, hechos):
+    # Posiciones de 'pares' (origen, destino) que no se movieron y nombres finales de los que cambiaron
+    reales = {origen: destino for destino, origen in hechos}
+    fallidos = []
+    renombrados = []
+    for i, (origen, destino) in enumerate(pares):
+        real = reales.get(origen)
+        if real is None:
+            fallidos.append(i)
+        elif real != destino:
+            renombrados.append([i, os.path.basename(real)])
+    return fallidos, renombrados
+
+
+def ejecutar_plan(plan, hilos=hilos_movimiento, lote=tamano_lote, diario=None, operacion=None, duplicados=None):
+    # Aplica el plan por lotes creando solo las carpetas que hacen falta. Si el disco cambió desde
+    # la planificación, NombresOcupados vuelve a resolver el nombre en lugar de sobrescribir.
+    # Con diario, cada lote se anota antes de moverlo y se confirma después. Sin operacion, se abre una
+    # con el primer lote que tenga algo que mover y se termina al acabar: organizar sin nada que hacer no
+    # ocupa un nivel del historial. El plan puede ser un generador (recorrer_organizables): solo se tiene
+    # en memoria el lote en curso.
+    # Con un DetectorDuplicados, los repetidos se omiten o se enlazan según su modo.
+    nombres = NombresOcupados()
+    dispositivos = {}
+    creadas = set()
+    completados, errores = MovimientosCompactos(), []
+    propia = False
+    plan = iter(plan)
+    while True:
+        bloque = list(itertools.islice(plan, lote))
+        if not bloque:
+            break
+        enlaces = []
+        if duplicados is not None:
+            originales = duplicados.buscar(bloque)
+            if duplicados.modo in ("omitir", "enlazar", "clonar"):
+                metodo = "clon" if duplicados.modo == "clonar" else "enlace"
+                nuevos = []
+                for movimiento, original in zip(bloque, originales):
+                    if original is None:
+                        nuevos.append(movimiento)
+                    elif duplicados.modo != "omitir":
+                        try:
+                            enlaces.append((movimiento, _enlace_para(metodo, original, movimiento.origen)))
+                        except OSError:
+                            nuevos.append(movimiento)  # lo que falle se verá al moverlo
+                bloque = nuevos
+        destinos = itertools.chain(bloque, (movimiento for movimiento, _ in enlaces))
+        for carpeta in {os.path.dirname(movimiento.destino) for movimiento in destinos} - creadas:
+            os.makedirs(carpeta, exist_ok=True)
+            creadas.add(carpeta)
+        pares = [(movimiento.origen, movimiento.destino) for movimiento in bloque]
+        pares.extend((movimiento.origen, movimiento.destino) for movimiento, _ in enlaces)
+        if diario is not None and pares:
+            if operacion is None:
+                operacion, propia = diario.iniciar(), True
+            diario.anotar_lote(operacion, pares, {len(bloque) + i: enlace for i, (_, enlace) in enumerate(enlaces)})
+        hechos, fallos = mover_en_paralelo(pares[:len(bloque)], hilos, nombres, dispositivos)
+        # Los enlaces van después: el original puede ser un archivo que acaba de llegar en este lote
+        enlazados = {}
+        for movimiento, enlace in enlaces:
+            try:
+                destino, enlazado = enlazar_duplicado(enlace.original, movimiento.origen, movimiento.destino,
+                                                      nombres, dispositivos, enlace.metodo)
+                hechos.append((str(destino), movimiento.origen))
+                if enlazado:
+                    enlazados[movimiento.origen] = enlace
+                else:
+                    duplicados.sin_enlace += 1
+            except OSError as e:
+                fallos.append(e)
+        if diario is not None and pares:
+            diario.confirmar_lote(operacion, *_diferencias_lote(pares, hechos))
+        for destino, origen in hechos:
+            completados.anadir(destino, origen, enlazados.get(origen))
+        errores.extend(fallos)
+    if propia:
+        diario.terminar(operacion)
+    return completados, errores
+
+
+def plan_a_json(plan):
+    return json.dumps([movimiento._asdict() for movimiento in plan], ensure_ascii=False, indent=1)
+
+
+def plan_desde_json(texto):
+    return tuple(Movimiento(**movimiento) for movimiento in json.loads(texto))
+
+
+def organizar_carpeta(folder_path, indice=None, hilos=hilos_movimiento, clasificador=None, plan=None,
+                      recursivo=False, exclusiones=None, duplicados=None):
+    global ultima_accion, ultima_carpeta, ultimos_duplicados
+    duplicados = modo_duplicados if duplicados is None else duplicados
+    detector = DetectorDuplicados(duplicados) if duplicados != "copiar" else None
+    if plan is None and recursivo:
+        plan = recorrer_organizables(folder_path, clasificador, exclusiones)
+    elif plan is None:
+        plan = planificar_organizacion(folder_path, clasificador, indice, exclusiones)
+
+    diario = abrir_diario(folder_path)
+    try:
+        movimientos, errores = ejecutar_plan(plan, hilos, diario=diario, duplicados=detector)
+    finally:
+        if diario is not None:
+            diario.cerrar()
+    # Aunque falle algún archivo, lo que sí se movió queda registrado para poder deshacerlo
+    ultima_accion, ultima_carpeta = movimientos, os.path.abspath(folder_path)
+    ultimos_duplicados = detector.encontrados if detector is not None else []
+    if errores:
+        raise errores[0]
+    if ultimos_duplicados:
+        lineas = [f"{organizacion_exitosa}"]
+        if len(ultimos_duplicados) > detector.sin_enlace:
+            lineas.append(msg_duplicados[detector.modo].format(len(ultimos_duplicados) - detector.sin_enlace))
+        if detector.sin_enlace:
+            lineas.append(msg_duplicados_sin_enlace.format(detector.sin_enlace))
+        return "\n".join(lineas)
     return f"{organizacion_exitosa}"
 
 
-def deshacer_accion():
-    global ultima_accion
-
-    if not ultima_accion:
-        return f"{ultima_accion_vacia}"
-
-    for destino, origen in reversed(ultima_accion):
-        if Path(destino).exists():
-            shutil.move(destino, origen)
-
-    primer_origen = ultima_accion[0][1]
-    carpeta_base = Path(primer_origen).parent
+def _limpiar_categorias_vacias(carpeta_base):
     categorias = list(CATEGORIES.keys())
     categorias.append("Otros")
 
@@ -108,35 +1293,1625 @@ def deshacer_accion():
             if len(contenido) == 0:
                 ruta.rmdir()
 
-    ultima_accion = []
-    return f"{msg_desacer_accion}"
 
+def _historial(carpeta):
+    # (diario, deshacer, rehacer) de la carpeta, o (None, [], []) si no tiene diario
+    if carpeta is None or not usar_diario or not DiarioMovimientos.existe(carpeta):
+        return None, [], []
+    diario = abrir_diario(carpeta)
+    if diario is None:
+        return None, [], []
+    try:
+        deshacer, rehacer = diario.historial()
+    except BaseException:
+        diario.cerrar()
+        raise
+    return diario, deshacer, rehacer
+
+
+def restaurar_movimientos(movimientos, hilos=hilos_movimiento, lote=tamano_lote):
+    # Devuelve cada (destino, origen) a su sitio, del último al primero y por lotes, con el mismo
+    # ejecutor paralelo que organizar. No se mira antes si el archivo sigue ahí: si falta, el propio
+    # rename falla y va al informe. Si el origen está ocupado se restaura como nombre_copyN.
+    # Las entradas con Enlace (duplicados) se separan además del original una vez en su sitio.
+    nombres = NombresOcupados()
+    dispositivos = {}
+    creadas = set()
+    restaurados = 0
+    renombrados = []
+    fallidos = []
+    enlaces = getattr(movimientos, "enlaces", {})
+    pendientes = iter(range(len(movimientos) - 1, -1, -1))
+    while True:
+        posiciones = list(itertools.islice(pendientes, lote))
+        if not posiciones:
+            break
+        pares, separar = [], []
+        for posicion in posiciones:
+            destino, origen = movimientos[posicion]
+            if destino != origen:
+                pares.append((destino, origen))
+            if posicion in enlaces:
+                separar.append((destino, origen, enlaces[posicion]))
+        # Un dirname vacío es la carpeta actual (organizar "."): ya existe
+        for carpeta in {os.path.dirname(origen) for _, origen in pares} - creadas - {""}:
+            os.makedirs(carpeta, exist_ok=True)
+            creadas.add(carpeta)
+        hechos, errores = mover_en_paralelo(pares, hilos, nombres, dispositivos, repartir=True)
+        sin_mover, con_otro_nombre = _diferencias_lote(pares, hechos)
+        fallidos.extend((pares[i][0], error) for i, error in zip(sin_mover, errores))
+        renombrados.extend((pares[i][1], os.path.join(os.path.dirname(pares[i][1]), nombre))
+                           for i, nombre in con_otro_nombre)
+        restaurados += len(hechos)
+        reales = {destino: final for final, destino in hechos}
+        for destino, origen, enlace in separar:
+            ruta = origen if destino == origen else reales.get(destino)
+            if ruta is None:
+                continue
+            try:
+                _separar_enlace(ruta, enlace)
+            except OSError as e:
+                fallidos.append((ruta, e))
+                continue
+            if destino == origen:
+                restaurados += 1
+    return InformeRestauracion(restaurados, renombrados, fallidos)
+
+
+def _restauracion_fallida(informe):
+    return not informe.restaurados and bool(informe.fallidos)
+
+
+def _mensaje_restauracion(informe, maximo=10):
+    lineas = [f"{msg_deshacer_fallido if _restauracion_fallida(informe) else msg_desacer_accion}"]
+    if informe.renombrados:
+        lineas.append(f"\n{len(informe.renombrados)} archivos se restauraron con otro nombre porque el original "
+                      "estaba ocupado:")
+        lineas.extend(f"  {original} -> {os.path.basename(final)}"
+                      for original, final in informe.renombrados[:maximo])
+    if informe.fallidos:
+        lineas.append(f"\nNo se pudieron restaurar {len(informe.fallidos)} archivos:")
+        lineas.extend(f"  {ruta}: {getattr(error, 'strerror', None) or error}"
+                      for ruta, error in informe.fallidos[:maximo])
+    if len(informe.renombrados) > maximo or len(informe.fallidos) > maximo:
+        lineas.append("  ...")
+    return "\n".join(lineas)
+
+
+def _marcar_deshecha(diario, operacion):
+    if operacion.pendientes is not None:
+        # Lo que se vio en disco del lote sin confirmar queda fijado: tras deshacer, esos archivos
+        # vuelven a estar en su origen y rehacer ya no podría saber cuáles se habían movido
+        diario.confirmar_lote(operacion.id, operacion.pendientes, [])
+    diario.marcar_deshecha(operacion.id)
+
+
+def deshacer_accion(carpeta=None, hilos=hilos_movimiento):
+    # Con diario se deshace la última organización de la carpeta que siga sin deshacer (aunque sea de
+    # una sesión anterior o quedara a medias); cada llamada retrocede un nivel más.
+    # El detalle de lo que no se pudo restaurar queda en ultimo_informe.
+    global ultima_accion, ultimo_informe
+
+    if carpeta is None and ultima_accion:
+        carpeta = ultima_carpeta or Path(ultima_accion[0][1]).parent
+    diario, deshacer, _ = _historial(carpeta)
+    try:
+        operacion = None
+        movimientos = ultima_accion
+        if diario is not None:
+            operacion = deshacer[-1] if deshacer else None
+            movimientos = operacion.movimientos if operacion is not None else []
+
+        if not movimientos:
+            return f"{ultima_accion_vacia}"
+
+        ultimo_informe = restaurar_movimientos(movimientos, hilos)
+
+        destino, primer_origen = movimientos[0]
+        if destino != primer_origen:
+            # Las carpetas de categoría cuelgan de la raíz organizada, no de donde estaba el primer archivo.
+            # Las sustituciones de deduplicar_carpeta no crean carpetas de categoría: no hay nada que limpiar.
+            raiz = operacion.carpeta if operacion is not None and operacion.carpeta else carpeta
+            _limpiar_categorias_vacias(Path(raiz) if raiz is not None else Path(primer_origen).parent)
+        # Si no volvió nada a su sitio la acción sigue aplicada: se queda en deshacer para reintentarla
+        if _restauracion_fallida(ultimo_informe):
+            return _mensaje_restauracion(ultimo_informe)
+        if operacion is not None:
+            _marcar_deshecha(diario, operacion)
+    finally:
+        if diario is not None:
+            diario.cerrar()
 
-def comprimir_carpeta_entera(carpeta, progreso_callback=None):
+    ultima_accion = []
+    return _mensaje_restauracion(ultimo_informe)
+
+
+def rehacer_accion(carpeta, hilos=hilos_movimiento, lote=tamano_lote):
+    # Vuelve a aplicar la última organización deshecha por lotes, como ejecutar_plan: cada lote se anota
+    # en el diario antes de moverlo y se confirma después, así un fallo a mitad deja deshacer al día.
+    # Si un destino está ocupado se resuelve el nombre como al organizar.
+    diario, _, rehacer = _historial(carpeta)
+    if diario is None or not rehacer:
+        if diario is not None:
+            diario.cerrar()
+        return f"{nada_que_rehacer}"
+    errores = []
+    cambiados = 0
+    try:
+        operacion = rehacer[-1]
+        movimientos = operacion.movimientos
+        enlaces = movimientos.enlaces
+        nombres = NombresOcupados()
+        dispositivos = {}
+        creadas = set()
+        diario.rehacer(operacion.id)
+        pendientes = iter(range(len(movimientos)))
+        while True:
+            bloque = list(itertools.islice(pendientes, lote))
+            if not bloque:
+                break
+            # Un repetido editado después de deshacer ya no es igual a su original: no se vuelve a enlazar.
+            # Si había que moverlo se mueve tal cual; si se sustituyó en su sitio se deja como está.
+            enlazar = set()
+            posiciones = []
+            for i in bloque:
+                if i in enlaces:
+                    destino, origen = movimientos[i]
+                    try:
+                        igual = _sigue_igual(origen, enlaces[i])
+                    except OSError:
+                        igual = True  # el fallo se verá al enlazarlo
+                    if igual:
+                        enlazar.add(i)
+                    else:
+                        cambiados += 1
+                        if destino == origen:
+                            continue
+                posiciones.append(i)
+            # Los duplicados van al final del lote: su original puede ser un archivo que llega en él
+            posiciones.sort(key=lambda i: i in enlazar)
+            if not posiciones:
+                continue
+            pares = []
+            for i in posiciones:
+                destino, origen = movimientos[i]
+                pares.append((origen, destino))
+            for destino_carpeta in {os.path.dirname(destino) for _, destino in pares} - creadas:
+                os.makedirs(destino_carpeta, exist_ok=True)
+                creadas.add(destino_carpeta)
+            sin_enlace = len(posiciones) - len(enlazar)
+            diario.anotar_lote(operacion.id, pares,
+                               {j: enlaces[i] for j, i in enumerate(posiciones[sin_enlace:], sin_enlace)})
+            hechos, fallos = mover_en_paralelo(pares[:sin_enlace], hilos, nombres, dispositivos)
+            # Los duplicados vuelven a ser enlaces (o clones) de su original en vez de copias propias
+            for i, (origen, destino) in zip(posiciones[sin_enlace:], pares[sin_enlace:]):
+                enlace = enlaces[i]
+                try:
+                    if origen == destino:
+                        _sustituir_por_enlace(enlace.metodo, enlace.original, destino)
+                    else:
+                        destino, _ = enlazar_duplicado(enlace.original, origen, destino, nombres, dispositivos,
+                                                       enlace.metodo)
+                    hechos.append((str(destino), origen))
+                except OSError as e:
+                    fallos.append(e)
+            diario.confirmar_lote(operacion.id, *_diferencias_lote(pares, hechos))
+            errores.extend(fallos)
+        diario.terminar(operacion.id)
+    finally:
+        diario.cerrar()
+    if errores:
+        raise errores[0]
+    if cambiados:
+        return f"{msg_rehacer_accion}\n{msg_rehacer_cambiados.format(cambiados)}"
+    return f"{msg_rehacer_accion}"
+
+
+def deshacer_plan(plan, hilos=hilos_movimiento):
+    # Devuelve cada archivo de un plan (p. ej. cargado con plan_desde_json) a su ubicación original
+    # La misma organización sigue en el diario: se marca como deshecha para no deshacerla dos veces.
+    global ultimo_informe
+    movimientos = [(movimiento.destino, movimiento.origen) for movimiento in plan]
+    ultimo_informe = restaurar_movimientos(movimientos, hilos)
+    if plan:
+        # Los destinos son <raíz>/<categoría>/<nombre>, también en recursivo
+        raiz = os.path.dirname(os.path.dirname(plan[0].destino))
+        _limpiar_categorias_vacias(Path(raiz))
+        if not _restauracion_fallida(ultimo_informe):
+            diario, deshacer, _ = _historial(raiz)
+            if diario is not None:
+                try:
+                    hechos = set(movimientos)
+                    for operacion in reversed(deshacer):
+                        if set(operacion.movimientos) == hechos:
+                            _marcar_deshecha(diario, operacion)
+                            break
+                finally:
+                    diario.cerrar()
+    return _mensaje_restauracion(ultimo_informe)
+
+
+# ------------------ COMPRESIÓN ------------------
+hilos_compresion = os.cpu_count() or 1  # hilos que comprimen miembros en paralelo (1 = secuencial)
+tamano_buffer_lectura = 4 * 1024 * 1024  # bloque de lectura de cada miembro (uno reutilizado por hilo)
+tamano_spool = 8 * 1024 * 1024  # lo comprimido que un hilo guarda en memoria antes de pasar a un temporal
+# Bytes (sin comprimir) de los miembros que se comprimen o esperan turno a la vez. Un miembro mayor se
+# escribe directamente en el ZIP, en orden: pasarlo por un temporal duplicaría lo que se escribe en disco.
+maximo_en_vuelo = 512 * 1024 * 1024
+
+# formato -> (contenedor, códec, extensión del archivo generado)
+FORMATOS_COMPRESION = {
+    "zip-deflate": ("zip", "deflate", ".zip"),
+    "zip-bzip2": ("zip", "bzip2", ".zip"),
+    "zip-lzma": ("zip", "lzma", ".zip"),
+    "tar.gz": ("tar", "deflate", ".tar.gz"),
+    "tar.xz": ("tar", "lzma", ".tar.xz"),
+    "tar.zst": ("tar", "zstd", ".tar.zst"),
+}
+# perfil -> nivel por códec (zipfile no permite elegir el preset de LZMA, solo se aplica en tar.xz)
+PERFILES_COMPRESION = {
+    "rapido": {"deflate": 1, "bzip2": 1, "lzma": 0, "zstd": 1},
+    "equilibrado": {"deflate": 6, "bzip2": 5, "lzma": 4, "zstd": 3},
+    "maximo": {"deflate": 9, "bzip2": 9, "lzma": 9, "zstd": 19},
+}
+formato_por_defecto = "zip-deflate"
+perfil_por_defecto = "equilibrado"
+# completo: archivo nuevo; anexar: añade al ZIP lo cambiado; diferencial: archivo aparte con lo cambiado
+MODOS_COMPRESION = ("completo", "anexar", "diferencial")
+muestra_medicion = 32 * 1024 * 1024  # bytes de la carpeta que se usan para medir los perfiles
+
+_METODOS_ZIP = {"deflate": zipfile.ZIP_DEFLATED, "bzip2": zipfile.ZIP_BZIP2, "lzma": zipfile.ZIP_LZMA}
+
+# Formatos que ya van comprimidos: se guardan tal cual (ZIP_STORED) porque deflate apenas gana nada.
+# Se decide por la categoría, con excepciones para los formatos sin comprimir de esas categorías.
+CATEGORIAS_YA_COMPRIMIDAS = ('Imágenes', 'Vídeos', 'Música', 'Archivos comprimidos')
+EXTENSIONES_SIN_COMPRIMIR = frozenset({'.bmp', '.tiff', '.wav', '.tar'})
+EXTENSIONES_YA_COMPRIMIDAS = frozenset({'.docx', '.xlsx', '.pptx'})
+muestrear_entropia = True  # para el resto, comprimir una muestra del primer bloque y decidir
+tamano_muestra = 64 * 1024
+ratio_muestra = 0.95  # si la muestra no baja de este ratio, el archivo se guarda sin comprimir
+
+
+def _modulo_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def formatos_disponibles():
+    return [formato for formato, (_, codec, _) in FORMATOS_COMPRESION.items()
+            if codec != "zstd" or _modulo_zstd() is not None]
+
+
+def _muestra_incompresible(ruta):
+    try:
+        with open(ruta, "rb") as f:
+            muestra = f.read(tamano_muestra)
+    except OSError:
+        return False
+    return bool(muestra) and len(zlib.compress(muestra, 1)) >= len(muestra) * ratio_muestra
+
+
+def metodo_compresion(ruta, tamano=None, clasificador=None, muestrear=muestrear_entropia,
+                      comprimido=zipfile.ZIP_DEFLATED):
+    clasificador = clasificador or CLASIFICADOR
+    nombre = os.path.basename(ruta).lower()
+    extension = os.path.splitext(nombre)[1]
+    if extension in EXTENSIONES_YA_COMPRIMIDAS:
+        return zipfile.ZIP_STORED
+    if extension not in EXTENSIONES_SIN_COMPRIMIR and clasificador.categoria(nombre) in CATEGORIAS_YA_COMPRIMIDAS:
+        return zipfile.ZIP_STORED
+    # En archivos pequeños la muestra costaría más que comprimirlos sin más
+    if muestrear and tamano is not None and tamano > 2 * tamano_muestra and _muestra_incompresible(ruta):
+        return zipfile.ZIP_STORED
+    return comprimido
+
+
+def _compresor(metodo, nivel):
+    if metodo == zipfile.ZIP_DEFLATED:
+        return zlib.compressobj(nivel, zlib.DEFLATED, -15)
+    if metodo == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Compressor(nivel)
+    return zipfile.LZMACompressor()
+
+
+_buffers_lectura = threading.local()
+
+
+def _abrir_secuencial(ruta):
+    # Avisa al sistema de que el archivo se leerá de principio a fin para que adelante más lectura
+    f = open(ruta, "rb", buffering=0)
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+    return f
+
+
+def _leer_bloques(ruta):
+    # readinto sobre un búfer por hilo que se reutiliza entre archivos: no se crea un bytes por bloque.
+    # Cada bloque (memoryview) solo es válido hasta pedir el siguiente.
+    buffer = getattr(_buffers_lectura, "buffer", None)
+    if buffer is None or len(buffer) != tamano_buffer_lectura:
+        buffer = _buffers_lectura.buffer = bytearray(tamano_buffer_lectura)
+    vista = memoryview(buffer)
+    with _abrir_secuencial(ruta) as f:
+        while True:
+            leidos = f.readinto(buffer)
+            if not leidos:
+                break
+            yield vista[:leidos]
+
+
+def _comprimir_miembro(ruta, metodo, nivel, carpeta_temporal=None):
+    # Se ejecuta en un hilo del pool: zlib, bz2 y lzma liberan el GIL mientras comprimen, así que
+    # varios miembros se comprimen a la vez en núcleos distintos. Lo que no cabe en memoria va a un
+    # temporal en carpeta_temporal (junto al ZIP, no en /tmp, que puede ser RAM).
+    compresor = _compresor(metodo, nivel)
+    salida = tempfile.SpooledTemporaryFile(max_size=tamano_spool, dir=carpeta_temporal)
+    crc = 0
+    tamano = 0
+    for bloque in _leer_bloques(ruta):
+        crc = zlib.crc32(bloque, crc)
+        tamano += len(bloque)
+        salida.write(compresor.compress(bloque))
+    salida.write(compresor.flush())
+    return crc, tamano, salida
+
+
+def _escribir_miembro(zipf, ruta, zinfo, nivel):
+    # Como ZipFile.write, pero leyendo en bloques grandes. zipfile decide si el miembro necesita Zip64
+    # a partir de zinfo.file_size; si el archivo ha crecido desde entonces, se fuerza.
+    try:
+        zinfo.file_size = os.stat(ruta).st_size
+    except OSError:
+        pass
+    zinfo._compresslevel = nivel
+    with zipf.open(zinfo, "w", force_zip64=zinfo.file_size > zipfile.ZIP64_LIMIT // 2) as destino:
+        for bloque in _leer_bloques(ruta):
+            destino.write(bloque)
+
+
+# Partes internas de ZipFile que usa _escribir_precomprimido. Si una versión de Python las cambia, se
+# comprime en serie con la API pública en vez de escribir un ZIP roto.
+_INTERNOS_ZIPFILE = ("fp", "_lock", "_writecheck", "start_dir", "_didModify", "filelist", "NameToInfo")
+
+
+def _admite_precomprimido(zipf):
+    return all(hasattr(zipf, atributo) for atributo in _INTERNOS_ZIPFILE)
+
+
+def _escribir_precomprimido(zipf, zinfo, crc, tamano, datos):
+    # zipfile no tiene API pública para añadir datos ya comprimidos; esto reproduce lo que hacen
+    # ZipFile.writestr/mkdir internamente (cabecera local, datos y alta en el directorio central).
+    comprimido = datos.seek(0, os.SEEK_END)
+    datos.seek(0)
+    zinfo.file_size = tamano
+    zinfo.compress_size = comprimido
+    zinfo.CRC = crc
+    if zinfo.compress_type == zipfile.ZIP_LZMA:
+        zinfo.flag_bits |= 0x02  # los datos LZMA llevan marca de fin de flujo, igual que en zipfile
+    zip64 = tamano > zipfile.ZIP64_LIMIT or comprimido > zipfile.ZIP64_LIMIT
+    with zipf._lock:
+        zipf.fp.seek(zipf.start_dir)
+        zinfo.header_offset = zipf.fp.tell()
+        zipf._writecheck(zinfo)
+        zipf._didModify = True
+        zipf.fp.write(zinfo.FileHeader(zip64))
+        shutil.copyfileobj(datos, zipf.fp, tamano_buffer_lectura)
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[zinfo.filename] = zinfo
+        zipf.start_dir = zipf.fp.tell()
+
+
+def _recorrer_archivos(carpeta, cancelar=None, exclusiones=None, recursivo=True):
+    # Generador: va dando (ruta, nombre dentro del archivo, tamaño, mtime) según recorre la carpeta,
+    # sin reunir antes la lista completa. La memoria solo depende de la profundidad del árbol.
+    # Las carpetas excluidas ni se listan.
+    exclusiones = EXCLUSIONES if exclusiones is None else exclusiones
+    pendientes = [(os.fspath(carpeta), "")]
+    while pendientes:
+        if cancelar is not None and cancelar.is_set():
+            return
+        ruta, prefijo = pendientes.pop()
+        try:
+            entradas = os.scandir(ruta)
+        except OSError:
+            continue
+        with entradas:
+            for entrada in entradas:
+                nombre = prefijo + entrada.name
+                try:
+                    if entrada.is_dir():
+                        if recursivo and not entrada.is_symlink() and not exclusiones.excluye(nombre, carpeta=True):
+                            pendientes.append((entrada.path, nombre + "/"))
+                        continue
+                    if exclusiones.excluye(nombre):
+                        continue
+                    info = entrada.stat()
+                except OSError:
+                    continue
+                yield entrada.path, nombre, info.st_size, info.st_mtime
+
+
+def _escribir_zip(destino, archivos, metodo, nivel, hilos, muestrear, avanzar, modo="w"):
+    def preparar():
+        for ruta, nombre, tamano, _ in archivos:
+            zinfo = zipfile.ZipInfo.from_file(ruta, arcname=nombre)
+            zinfo.compress_type = metodo_compresion(ruta, tamano, muestrear=muestrear, comprimido=metodo)
+            yield ruta, zinfo
+
+    with zipfile.ZipFile(destino, modo, metodo, compresslevel=nivel) as zipf:
+        miembros = preparar()
+
+        if hilos > 1 and not _admite_precomprimido(zipf):
+            warnings.warn("Esta versión de zipfile no permite escribir miembros comprimidos en paralelo; "
+                          "se comprime en serie.", RuntimeWarning)
+            hilos = 1
+        if hilos <= 1:
+            for ruta, zinfo in miembros:
+                _escribir_miembro(zipf, ruta, zinfo, nivel)
+                avanzar(zinfo.file_size)
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+        # Los miembros se comprimen en paralelo pero se escriben en el orden del recorrido; la ventana
+        # limita cuántos hay comprimidos esperando turno y maximo_en_vuelo cuántos bytes suman. Cada uno
+        # guarda en memoria hasta tamano_spool y el resto en un temporal junto al ZIP.
+        ventana = hilos * 2
+        pendientes = deque()
+        carpeta_temporal = os.path.dirname(os.path.abspath(destino))
+        en_vuelo = 0
+
+        def escribir_siguiente():
+            nonlocal en_vuelo
+            ruta, zinfo, futuro = pendientes.popleft()
+            if futuro is None:
+                # Sin comprimir o demasiado grande: se escribe directamente al llegar su turno
+                _escribir_miembro(zipf, ruta, zinfo, nivel)
+            else:
+                crc, tamano, datos = futuro.result()
+                en_vuelo -= zinfo.file_size
+                with datos:
+                    _escribir_precomprimido(zipf, zinfo, crc, tamano, datos)
+            avanzar(zinfo.file_size)
+
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            for ruta, zinfo in miembros:
+                futuro = None
+                if zinfo.compress_type != zipfile.ZIP_STORED and zinfo.file_size <= maximo_en_vuelo:
+                    while pendientes and en_vuelo + zinfo.file_size > maximo_en_vuelo:
+                        escribir_siguiente()
+                    futuro = pool.submit(_comprimir_miembro, ruta, zinfo.compress_type, nivel, carpeta_temporal)
+                    en_vuelo += zinfo.file_size
+                pendientes.append((ruta, zinfo, futuro))
+                if len(pendientes) > ventana:
+                    escribir_siguiente()
+            while pendientes:
+                escribir_siguiente()
+
+
+def _anadir_a_tar(tar, ruta, nombre):
+    # Como tar.add(recursive=False), pero abriendo el archivo para lectura secuencial
+    tar.copybufsize = tamano_buffer_lectura
+    tarinfo = tar.gettarinfo(ruta, arcname=nombre)
+    if not tarinfo.isreg():
+        tar.addfile(tarinfo)
+        return
+    with _abrir_secuencial(ruta) as f:
+        tar.addfile(tarinfo, f)
+
+
+def _escribir_tar(destino, archivos, codec, nivel, avanzar):
+    # En tar todo va en un único flujo comprimido; zstd sí puede usar varios núcleos (threads=-1)
+    if codec == "zstd":
+        zstd = _modulo_zstd()
+        if zstd is None:
+            raise RuntimeError("El formato tar.zst necesita el módulo 'zstandard'.")
+        with open(destino, "wb") as f:
+            with zstd.ZstdCompressor(level=nivel, threads=-1).stream_writer(f) as flujo:
+                with tarfile.open(fileobj=flujo, mode="w|") as tar:
+                    for ruta, nombre, tamano, _ in archivos:
+                        _anadir_a_tar(tar, ruta, nombre)
+                        avanzar(tamano)
+        return
+    if codec == "deflate":
+        tar = tarfile.open(destino, "w:gz", compresslevel=nivel)
+    else:
+        tar = tarfile.open(destino, "w:xz", preset=nivel)
+    with tar:
+        for ruta, nombre, tamano, _ in archivos:
+            _anadir_a_tar(tar, ruta, nombre)
+            avanzar(tamano)
+
+
+def _ruta_manifiesto(archivo):
+    return Path(str(archivo) + ".manifest.json")
+
+
+def _hash_archivo(ruta):
+    resumen = hashlib.sha1()
+    for bloque in _leer_bloques(ruta):
+        resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+def _cargar_manifiesto(archivo):
+    try:
+        with open(_ruta_manifiesto(archivo), encoding="utf-8") as f:
+            return json.load(f)["archivos"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class _EscritorManifiesto:
+    # Escribe el manifiesto entrada a entrada según se comprime, sin tenerlo entero en memoria.
+    # Se escribe en un temporal y solo sustituye al anterior al confirmar.
+    def __init__(self, archivo):
+        self.ruta = _ruta_manifiesto(archivo)
+        self._temporal = self.ruta.with_name(self.ruta.name + ".tmp")
+        self._f = open(self._temporal, "w", encoding="utf-8")
+        self._f.write('{"version": 1, "archivos": {')
+        self._separador = ""
+
+    def anotar(self, nombre, entrada):
+        self._f.write(f"{self._separador}{json.dumps(nombre, ensure_ascii=False)}: {json.dumps(entrada)}")
+        self._separador = ", "
+
+    def confirmar(self):
+        self._f.write("}}")
+        self._f.close()
+        os.replace(self._temporal, self.ruta)
+
+    def descartar(self):
+        self._f.close()
+        try:
+            os.remove(self._temporal)
+        except OSError:
+            pass
+
+
+def _sin_cambios(archivos, usar_hash, anotar):
+    for ruta, nombre, tamano, mtime in archivos:
+        anotar(nombre, [tamano, mtime, _hash_archivo(ruta) if usar_hash else None])
+        yield ruta, nombre, tamano, mtime
+
+
+def _cambios_desde_manifiesto(archivos, manifiesto, usar_hash, anotar):
+    # Un archivo cambia si es nuevo o si difieren tamaño o mtime; con usar_hash y el mismo tamaño
+    # se compara además el contenido, para no volver a guardar archivos que solo se han "tocado".
+    # Las entradas vistas se sacan del manifiesto: al terminar solo quedan los archivos borrados.
+    for ruta, nombre, tamano, mtime in archivos:
+        anterior = manifiesto.pop(nombre, None)
+        resumen = None
+        if anterior is not None and anterior[0] == tamano and anterior[1] == mtime:
+            anotar(nombre, anterior)
+            continue
+        if usar_hash:
+            resumen = _hash_archivo(ruta)
+            if anterior is not None and anterior[0] == tamano and anterior[2] == resumen:
+                anotar(nombre, [tamano, mtime, resumen])
+                continue
+        anotar(nombre, [tamano, mtime, resumen])
+        yield ruta, nombre, tamano, mtime
+
+
+def _total_desde_indice(carpeta, exclusiones=None):
+    # Bytes de la carpeta según el índice de metadatos, si ya existe (sin recorrer el disco)
+    if not usar_indice or not IndiceCarpeta.existe(carpeta, exclusiones):
+        return None
+    indice = abrir_indice(carpeta, exclusiones)
+    if indice is None:
+        return None
+    try:
+        return indice.tamano_total()
+    except sqlite3.Error:
+        return None
+    finally:
+        indice.cerrar()
+
+
+class _EstimadorTotal:
+    # Cuenta en segundo plano los bytes que habrá que escribir mientras el compresor ya está trabajando.
+    # Con manifiesto solo cuenta lo cambiado; puede quedarse algo corto o largo, solo se usa para el progreso.
+    def __init__(self, carpeta, manifiesto=None, exclusiones=None):
+        self.total = 0
+        self._cancelar = threading.Event()
+        self._hilo = threading.Thread(target=self._contar, args=(carpeta, manifiesto, exclusiones), daemon=True)
+        self._hilo.start()
+
+    def _contar(self, carpeta, manifiesto, exclusiones):
+        for _, nombre, tamano, mtime in _recorrer_archivos(carpeta, self._cancelar, exclusiones):
+            if manifiesto is not None:
+                anterior = manifiesto.get(nombre)
+                if anterior is not None and anterior[0] == tamano and anterior[1] == mtime:
+                    continue
+            self.total += tamano
+
+    def detener(self):
+        self._cancelar.set()
+
+
+def comprimir_carpeta_entera(carpeta, progreso_callback=None, hilos=hilos_compresion, formato=formato_por_defecto,
+                             perfil=perfil_por_defecto, muestrear=muestrear_entropia, modo="completo",
+                             usar_hash=False, exclusiones=None):
+    # progreso_callback recibe (bytes procesados, bytes totales estimados).
+    # modo: "completo" rehace el archivo; "anexar" añade al ZIP existente solo lo nuevo o modificado;
+    # "diferencial" crea <carpeta>_dif_<fecha> con lo cambiado desde la última copia completa.
+    # Devuelve la ruta del archivo escrito, o None si no había cambios que guardar.
     carpeta = Path(carpeta)
-    zip_path = carpeta.with_suffix(".zip")
-    archivos = []
-    for root, _, files in os.walk(carpeta):
-        for file in files:
-            ruta = Path(root) / file
-            archivos.append(ruta)
-    total = len(archivos)
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for i, ruta in enumerate(archivos, 1):
-            zipf.write(ruta, arcname=ruta.relative_to(carpeta))
+    contenedor, codec, extension = FORMATOS_COMPRESION[formato]
+    nivel = PERFILES_COMPRESION[perfil][codec]
+    zip_path = carpeta.with_suffix(extension)
+    if modo == "anexar" and contenedor != "zip":
+        raise ValueError("El modo anexar solo está disponible para formatos ZIP.")
+
+    # Sin copia previa (o sin su manifiesto) no hay con qué comparar: se hace una completa
+    manifiesto = _cargar_manifiesto(zip_path) if modo != "completo" and zip_path.exists() else None
+    if manifiesto is None:
+        modo = "completo"
+    # El diferencial se calcula siempre contra la última copia completa (o anexada): no toca el manifiesto
+    escritor = None if modo == "diferencial" else _EscritorManifiesto(zip_path)
+    anotar = escritor.anotar if escritor else lambda nombre, entrada: None
+    estimador = None
+    temporal = None
+    try:
+        if manifiesto is None:
+            archivos = _sin_cambios(_recorrer_archivos(carpeta, exclusiones=exclusiones), usar_hash, anotar)
+            total = _total_desde_indice(carpeta, exclusiones)
+            if total is None:
+                estimador = _EstimadorTotal(carpeta, exclusiones=exclusiones)
+        else:
+            estimador = _EstimadorTotal(carpeta, dict(manifiesto), exclusiones)
+            archivos = _cambios_desde_manifiesto(_recorrer_archivos(carpeta, exclusiones=exclusiones), manifiesto,
+                                                 usar_hash, anotar)
+            # Se mira el primer cambio antes de crear nada, para no dejar un archivo vacío
+            primero = next(archivos, None)
+            if primero is None and not manifiesto:
+                if escritor:
+                    escritor.descartar()
+                return None
+            archivos = itertools.chain([primero] if primero else [], archivos)
+
+        destino = zip_path
+        if modo == "diferencial":
+            destino = carpeta.with_name(f"{carpeta.name}_dif_{datetime.now():%Y%m%d_%H%M%S}{extension}")
+        # Salvo al anexar, se escribe en un temporal junto al destino: si algo falla, la copia anterior y su
+        # manifiesto siguen intactos y coinciden entre sí
+        escribir_en = destino
+        if modo != "anexar":
+            escribir_en = temporal = destino.with_name(destino.name + ".tmp")
+        hechos = 0
+
+        def avanzar(tamano):
+            nonlocal hechos
+            hechos += tamano
             if progreso_callback:
-                progreso_callback(i, total)
-    return zip_path
+                estimado = estimador.total if estimador else total
+                progreso_callback(hechos, max(estimado, hechos))
+
+        if contenedor == "tar":
+            _escribir_tar(escribir_en, archivos, codec, nivel, avanzar)
+        elif modo == "anexar":
+            # Los modificados quedan dos veces en el ZIP; al extraer se queda la última copia. Si falla a
+            # medias, lo que ya estaba sigue dentro y el manifiesto anterior solo hace que se repita lo nuevo.
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                _escribir_zip(escribir_en, archivos, _METODOS_ZIP[codec], nivel, hilos, muestrear, avanzar, modo="a")
+        else:
+            _escribir_zip(escribir_en, archivos, _METODOS_ZIP[codec], nivel, hilos, muestrear, avanzar)
+        if temporal is not None:
+            os.replace(temporal, destino)
+    except BaseException:
+        if escritor:
+            escritor.descartar()
+        if temporal is not None:
+            try:
+                os.remove(temporal)
+            except OSError:
+                pass
+        raise
+    finally:
+        if estimador:
+            estimador.detener()
+
+    # El manifiesto se confirma después del archivo: si se corta entre medias, el manifiesto viejo describe
+    # una copia más antigua y lo único que pasa es que se vuelve a guardar algo que ya estaba
+    if escritor:
+        escritor.confirmar()
+    if modo == "diferencial" and manifiesto:
+        # Lo que queda en el manifiesto son los archivos que ya no existen
+        with open(str(destino) + ".borrados.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(sorted(manifiesto)) + "\n")
+    return destino
+
+
+def _compresor_medicion(contenedor, codec, nivel):
+    # El mismo compresor que usaría comprimir_carpeta_entera con ese formato y nivel
+    if contenedor == "zip":
+        return _compresor(_METODOS_ZIP[codec], nivel)
+    if codec == "deflate":
+        return zlib.compressobj(nivel, zlib.DEFLATED, 31)
+    if codec == "lzma":
+        return lzma.LZMACompressor(preset=nivel)
+    return _modulo_zstd().ZstdCompressor(level=nivel).compressobj()
+
+
+def _comprimir_en_memoria(compresor, bloques):
+    return sum(len(compresor.compress(bloque)) for bloque in bloques) + len(compresor.flush())
+
+
+def _guardar_en_memoria(bloques):
+    # Lo que cuesta en ZIP un miembro guardado sin comprimir: su CRC y copiarlo a la salida
+    salida = bytearray()
+    for bloque in bloques:
+        zlib.crc32(bloque)
+        salida += bloque
+    return len(salida)
+
+
+def medir_perfiles(carpeta, muestra=muestra_medicion, formatos=None, perfiles=None, exclusiones=None):
+    # Comprime en memoria una muestra de la carpeta con cada formato y perfil, y devuelve
+    # MB/s y ratio (tamaño comprimido / original) de cada combinación.
+    bloques = []
+    guardados = []  # bloques que en ZIP irían sin comprimir (ZIP_STORED)
+    leidos = 0
+    for ruta, _, tamano, _ in _recorrer_archivos(carpeta, exclusiones=exclusiones):
+        if leidos >= muestra:
+            break
+        try:
+            with open(ruta, "rb") as f:
+                bloque = f.read(min(muestra - leidos, 4 * 1024 * 1024))
+        except OSError:
+            continue
+        leidos += len(bloque)
+        bloques.append(bloque)
+        guardados.append(metodo_compresion(ruta, tamano) == zipfile.ZIP_STORED)
+
+    resultados = []
+    if not leidos:
+        return resultados
+    for formato in formatos or formatos_disponibles():
+        contenedor, codec, _ = FORMATOS_COMPRESION[formato]
+        for perfil in perfiles or PERFILES_COMPRESION:
+            nivel = PERFILES_COMPRESION[perfil][codec]
+            if contenedor == "zip":
+                a_comprimir = [b for b, guardado in zip(bloques, guardados) if not guardado]
+                a_guardar = [b for b, guardado in zip(bloques, guardados) if guardado]
+            else:
+                a_comprimir, a_guardar = bloques, []
+            # Todo lo leído entra en el tiempo, también lo guardado sin comprimir: si no, los MB/s de ZIP
+            # saldrían inflados y no se podrían comparar con los de tar
+            inicio = time.perf_counter()
+            compresor = _compresor_medicion(contenedor, codec, nivel)
+            comprimido = _comprimir_en_memoria(compresor, a_comprimir) if a_comprimir else 0
+            if contenedor == "zip":
+                for bloque in a_comprimir:
+                    zlib.crc32(bloque)  # zipfile calcula el CRC aparte del compresor
+            sin_comprimir = _guardar_en_memoria(a_guardar)
+            segundos = max(time.perf_counter() - inicio, 1e-6)
+            resultados.append({
+                "formato": formato,
+                "perfil": perfil,
+                "mb_s": round(leidos / segundos / 1e6, 1),
+                "ratio": round((comprimido + sin_comprimir) / leidos, 3),
+            })
+    return resultados
+
+
+# ------------------ ESTADÍSTICAS ------------------
+def obtener_categoria(nombre):
+    return CLASIFICADOR.categoria(nombre)
+
+
+def calcular_estadisticas(carpeta, cancelar=None, progreso_callback=None, cada=intervalo_estadisticas,
+                          clasificador=None, exclusiones=None):
+    # Un único recorrido con os.scandir: se reutiliza la información de cada DirEntry
+    # en lugar de volver a consultar el disco por cada archivo.
+    carpeta = os.fspath(carpeta)
+    if not os.path.isdir(carpeta):
+        raise FileNotFoundError(f"La carpeta '{carpeta}' no existe.")
+    clasificador = clasificador or CLASIFICADOR
+    exclusiones = EXCLUSIONES if exclusiones is None else exclusiones
+
+    estadisticas = {
+        "archivos": 0,
+        "carpetas": 0,
+        "archivos_totales": 0,
+        "carpetas_totales": 0,
+        "bytes": 0,
+        "profundidad": 0,
+        "por_categoria": {categoria: {"archivos": 0, "bytes": 0} for categoria in clasificador.categorias},
+    }
+    por_categoria = estadisticas["por_categoria"]
+
+    procesadas = 0
+    pendientes = [(carpeta, 0, "")]
+    while pendientes:
+        if cancelar is not None and cancelar.is_set():
+            return None
+        ruta, nivel, prefijo = pendientes.pop()
+        try:
+            entradas = os.scandir(ruta)
+        except OSError:
+            if nivel == 0:
+                raise
+            continue
+        with entradas:
+            for entrada in entradas:
+                procesadas += 1
+                if progreso_callback and procesadas % cada == 0:
+                    if cancelar is not None and cancelar.is_set():
+                        return None
+                    progreso_callback(dict(estadisticas))
+                relativa = prefijo + entrada.name
+                try:
+                    if entrada.is_dir(follow_symlinks=False):
+                        if exclusiones.excluye(relativa, carpeta=True):
+                            continue
+                        estadisticas["carpetas_totales"] += 1
+                        if nivel == 0:
+                            estadisticas["carpetas"] += 1
+                        if nivel + 1 > estadisticas["profundidad"]:
+                            estadisticas["profundidad"] = nivel + 1
+                        pendientes.append((entrada.path, nivel + 1, relativa + "/"))
+                        continue
+                    if not entrada.is_file() or exclusiones.excluye(relativa):
+                        continue
+                    tamano = entrada.stat().st_size
+                except OSError:
+                    continue
+                estadisticas["archivos_totales"] += 1
+                estadisticas["bytes"] += tamano
+                categoria = por_categoria[clasificador.categoria(entrada.name)]
+                categoria["archivos"] += 1
+                categoria["bytes"] += tamano
+                if nivel == 0 and not entrada.name.lower().endswith(".ini"):
+                    estadisticas["archivos"] += 1
+    return estadisticas
+
+
+# ------------------ ÍNDICE DE METADATOS ------------------
+# Índice SQLite por carpeta raíz. Solo se vuelven a listar las subcarpetas cuyo mtime ha cambiado;
+# ojo: editar un archivo "en el sitio" no cambia el mtime de su carpeta, para eso está completo=True.
+usar_indice = True
+carpeta_indices = Path.home() / ".folderwizard" / "indices"
+
+
+def _delta_vacio(categorias=CLASIFICADOR.categorias):
+    return {
+        "archivos": 0,
+        "carpetas": 0,
+        "archivos_totales": 0,
+        "carpetas_totales": 0,
+        "bytes": 0,
+        "por_categoria": {categoria: {"archivos": 0, "bytes": 0} for categoria in categorias},
+    }
+
+
+class IndiceCarpeta:
+    def __init__(self, carpeta, ruta_indice=None, clasificador=None, exclusiones=None):
+        self.carpeta = os.path.abspath(os.fspath(carpeta))
+        self.clasificador = clasificador or CLASIFICADOR
+        self.exclusiones = EXCLUSIONES if exclusiones is None else exclusiones
+        if ruta_indice is None:
+            ruta_indice = IndiceCarpeta.ruta_para(self.carpeta, self.exclusiones)
+            ruta_indice.parent.mkdir(parents=True, exist_ok=True)
+        self.ruta_indice = Path(ruta_indice)
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(str(self.ruta_indice), timeout=30, check_same_thread=False)
+        with self._conexion:
+            self._conexion.executescript("""
+                CREATE TABLE IF NOT EXISTS directorios (
+                    ruta TEXT PRIMARY KEY, padre TEXT, nivel INTEGER, mtime REAL);
+                CREATE INDEX IF NOT EXISTS directorios_padre ON directorios(padre);
+                CREATE INDEX IF NOT EXISTS directorios_nivel ON directorios(nivel);
+                CREATE TABLE IF NOT EXISTS archivos (
+                    ruta TEXT PRIMARY KEY, directorio TEXT, nombre TEXT, tamano INTEGER,
+                    mtime REAL, extension TEXT, categoria TEXT);
+                DROP INDEX IF EXISTS archivos_directorio;
+                CREATE INDEX IF NOT EXISTS archivos_directorio_mtime ON archivos(directorio, mtime);
+                CREATE INDEX IF NOT EXISTS archivos_mtime ON archivos(mtime);
+            """)
+
+    @staticmethod
+    def ruta_para(carpeta, exclusiones=None):
+        # Un índice por carpeta y juego de exclusiones: si cambian las reglas se indexa de nuevo
+        carpeta = os.path.abspath(os.fspath(carpeta))
+        exclusiones = EXCLUSIONES if exclusiones is None else exclusiones
+        nombre = hashlib.sha1(carpeta.encode("utf-8", "surrogateescape")).hexdigest()
+        return carpeta_indices / f"{nombre}-{exclusiones.huella}.sqlite3"
+
+    @staticmethod
+    def existe(carpeta, exclusiones=None):
+        return IndiceCarpeta.ruta_para(carpeta, exclusiones).exists()
+
+    def cerrar(self):
+        self._conexion.close()
+
+    def _absoluta(self, relativa):
+        return os.path.join(self.carpeta, relativa) if relativa else self.carpeta
+
+    def actualizar(self, cancelar=None, completo=False, recursivo=True):
+        # Devuelve los cambios (delta) respecto al contenido anterior del índice, o None si se cancela
+        delta = _delta_vacio(self.clasificador.categorias)
+        with self._lock, self._conexion:
+            cursor = self._conexion.cursor()
+            pendientes = [("", 0)]
+            while pendientes:
+                if cancelar is not None and cancelar.is_set():
+                    return None
+                relativa, nivel = pendientes.pop()
+                try:
+                    mtime = os.stat(self._absoluta(relativa)).st_mtime
+                except OSError:
+                    if not relativa:
+                        raise FileNotFoundError(f"La carpeta '{self.carpeta}' no existe.")
+                    self._borrar_subarbol(cursor, relativa, delta)
+                    continue
+                fila = cursor.execute("SELECT mtime FROM directorios WHERE ruta = ?", (relativa,)).fetchone()
+                if not completo and fila is not None and fila[0] == mtime:
+                    subcarpetas = cursor.execute("SELECT ruta, nivel FROM directorios WHERE padre = ?",
+                                                 (relativa,)).fetchall()
+                else:
+                    subcarpetas = self._reindexar_directorio(cursor, relativa, nivel, mtime, delta)
+                if recursivo:
+                    pendientes.extend(subcarpetas)
+        return delta
+
+    def reindexar_directorio(self, relativa):
+        # Vuelve a listar una sola carpeta (la usan los vigilantes) y devuelve el delta
+        delta = _delta_vacio(self.clasificador.categorias)
+        with self._lock, self._conexion:
+            cursor = self._conexion.cursor()
+            fila = cursor.execute("SELECT nivel FROM directorios WHERE ruta = ?", (relativa,)).fetchone()
+            if fila is None:
+                return delta
+            try:
+                mtime = os.stat(self._absoluta(relativa)).st_mtime
+            except OSError:
+                if relativa:
+                    self._borrar_subarbol(cursor, relativa, delta)
+                return delta
+            pendientes = [(sub, nivel) for sub, nivel in
+                          self._reindexar_directorio(cursor, relativa, fila[0], mtime, delta)]
+            # Las subcarpetas nuevas todavía no están indexadas: se recorren enteras
+            while pendientes:
+                sub, nivel = pendientes.pop()
+                if cursor.execute("SELECT mtime FROM directorios WHERE ruta = ?", (sub,)).fetchone()[0] is None:
+                    try:
+                        mtime = os.stat(self._absoluta(sub)).st_mtime
+                    except OSError:
+                        continue
+                    pendientes.extend(self._reindexar_directorio(cursor, sub, nivel, mtime, delta))
+        return delta
+
+    def _reindexar_directorio(self, cursor, relativa, nivel, mtime, delta):
+        anteriores = {nombre: (tamano, categoria) for nombre, tamano, categoria in cursor.execute(
+            "SELECT nombre, tamano, categoria FROM archivos WHERE directorio = ?", (relativa,))}
+        carpetas_anteriores = {ruta for (ruta,) in cursor.execute(
+            "SELECT ruta FROM directorios WHERE padre = ?", (relativa,))}
+
+        archivos = []
+        subcarpetas = []
+        try:
+            with os.scandir(self._absoluta(relativa)) as entradas:
+                for entrada in entradas:
+                    ruta = os.path.join(relativa, entrada.name)
+                    try:
+                        if entrada.is_dir(follow_symlinks=False):
+                            if not self.exclusiones.excluye(ruta, carpeta=True):
+                                subcarpetas.append((ruta, nivel + 1))
+                        elif entrada.is_file() and not self.exclusiones.excluye(ruta):
+                            info = entrada.stat()
+                            archivos.append((entrada.name, info.st_size, info.st_mtime))
+                    except OSError:
+                        continue
+        except OSError:
+            return []
+
+        filas = []
+        vistos = set()
+        for nombre, tamano, mtime_archivo in archivos:
+            vistos.add(nombre)
+            categoria = self.clasificador.categoria(nombre)
+            anterior = anteriores.get(nombre)
+            if anterior is not None:
+                self._sumar_delta(delta, relativa, nombre, anterior[1], anterior[0], -1)
+            self._sumar_delta(delta, relativa, nombre, categoria, tamano, 1)
+            filas.append((os.path.join(relativa, nombre), relativa, nombre, tamano, mtime_archivo,
+                          os.path.splitext(nombre)[1].lower(), categoria))
+        borrados = [nombre for nombre in anteriores if nombre not in vistos]
+        for nombre in borrados:
+            self._sumar_delta(delta, relativa, nombre, anteriores[nombre][1], anteriores[nombre][0], -1)
+        cursor.executemany("DELETE FROM archivos WHERE ruta = ?",
+                           [(os.path.join(relativa, nombre),) for nombre in borrados])
+        cursor.executemany("INSERT OR REPLACE INTO archivos VALUES (?, ?, ?, ?, ?, ?, ?)", filas)
+
+        actuales = {ruta for ruta, _ in subcarpetas}
+        for ruta in carpetas_anteriores - actuales:
+            self._borrar_subarbol(cursor, ruta, delta)
+        nuevas = [(ruta, relativa, nivel_sub, None) for ruta, nivel_sub in subcarpetas
+                  if ruta not in carpetas_anteriores]
+        for _ in nuevas:
+            delta["carpetas_totales"] += 1
+            if not relativa:
+                delta["carpetas"] += 1
+        cursor.executemany("INSERT OR REPLACE INTO directorios VALUES (?, ?, ?, ?)", nuevas)
+        cursor.execute("INSERT OR REPLACE INTO directorios VALUES (?, ?, ?, ?)",
+                       (relativa, os.path.dirname(relativa) if relativa else None, nivel, mtime))
+        return subcarpetas
+
+    def _borrar_subarbol(self, cursor, relativa, delta):
+        # Rango [relativa/, relativa0): todo lo que cuelga de la carpeta sin usar LIKE
+        desde = relativa + os.sep
+        hasta = relativa + chr(ord(os.sep) + 1)
+        for directorio, nombre, tamano, categoria in cursor.execute(
+                "SELECT directorio, nombre, tamano, categoria FROM archivos "
+                "WHERE directorio = ? OR (directorio >= ? AND directorio < ?)", (relativa, desde, hasta)).fetchall():
+            self._sumar_delta(delta, directorio, nombre, categoria, tamano, -1)
+        cursor.execute("DELETE FROM archivos WHERE directorio = ? OR (directorio >= ? AND directorio < ?)",
+                       (relativa, desde, hasta))
+        carpetas = cursor.execute("SELECT COUNT(*) FROM directorios WHERE ruta = ? OR (ruta >= ? AND ruta < ?)",
+                                  (relativa, desde, hasta)).fetchone()[0]
+        delta["carpetas_totales"] -= carpetas
+        if carpetas and os.sep not in relativa:
+            delta["carpetas"] -= 1
+        cursor.execute("DELETE FROM directorios WHERE ruta = ? OR (ruta >= ? AND ruta < ?)", (relativa, desde, hasta))
+
+    @staticmethod
+    def _sumar_delta(delta, directorio, nombre, categoria, tamano, signo):
+        delta["archivos_totales"] += signo
+        delta["bytes"] += signo * tamano
+        por_categoria = delta["por_categoria"].setdefault(categoria, {"archivos": 0, "bytes": 0})
+        por_categoria["archivos"] += signo
+        por_categoria["bytes"] += signo * tamano
+        if not directorio and not nombre.lower().endswith(".ini"):
+            delta["archivos"] += signo
+
+    def estadisticas(self):
+        # Mismo formato que calcular_estadisticas, pero leído del índice
+        with self._lock:
+            cursor = self._conexion.cursor()
+            estadisticas = _delta_vacio(self.clasificador.categorias)
+            estadisticas["archivos"] = cursor.execute(
+                "SELECT COUNT(*) FROM archivos WHERE directorio = '' AND lower(nombre) NOT LIKE '%.ini'").fetchone()[0]
+            estadisticas["carpetas"] = cursor.execute(
+                "SELECT COUNT(*) FROM directorios WHERE padre = ''").fetchone()[0]
+            estadisticas["archivos_totales"], estadisticas["bytes"] = cursor.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM archivos").fetchone()
+            estadisticas["carpetas_totales"], estadisticas["profundidad"] = cursor.execute(
+                "SELECT COUNT(*), COALESCE(MAX(nivel), 0) FROM directorios WHERE ruta != ''").fetchone()
+            for categoria, numero, tamano in cursor.execute(
+                    "SELECT categoria, COUNT(*), SUM(tamano) FROM archivos GROUP BY categoria"):
+                estadisticas["por_categoria"][categoria] = {"archivos": numero, "bytes": tamano}
+        return estadisticas
+
+    def tamano_total(self):
+        with self._lock:
+            return self._conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM archivos").fetchone()[0]
+
+    def profundidad(self):
+        with self._lock:
+            return self._conexion.execute("SELECT COALESCE(MAX(nivel), 0) FROM directorios").fetchone()[0]
+
+    def directorios(self, desde=""):
+        # (ruta relativa, mtime) de las carpetas indexadas, de la más superficial a la más profunda
+        consulta = "SELECT ruta, mtime FROM directorios"
+        parametros = []
+        if desde:
+            consulta += " WHERE ruta = ? OR (ruta >= ? AND ruta < ?)"
+            parametros = [desde, desde + os.sep, desde + chr(ord(os.sep) + 1)]
+        with self._lock:
+            return self._conexion.execute(consulta + " ORDER BY nivel", parametros).fetchall()
+
+    def archivos(self, directorio="", desde_mtime=None, recursivo=False):
+        # Devuelve (ruta relativa, tamaño, mtime, categoría) de los archivos indexados
+        consulta = "SELECT ruta, tamano, mtime, categoria FROM archivos"
+        condiciones, parametros = [], []
+        if not recursivo:
+            condiciones.append("directorio = ?")
+            parametros.append(directorio)
+        elif directorio:
+            condiciones.append("(directorio = ? OR (directorio >= ? AND directorio < ?))")
+            parametros += [directorio, directorio + os.sep, directorio + chr(ord(os.sep) + 1)]
+        if desde_mtime is not None:
+            condiciones.append("mtime > ?")
+            parametros.append(desde_mtime)
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        with self._lock:
+            return self._conexion.execute(consulta, parametros).fetchall()
+
+    def recientes(self, desde=None, hasta=None, recursivo=False, limite=None, saltar=0):
+        # (ruta relativa, tamaño, mtime) del más nuevo al más antiguo. SQLite recorre al revés el índice
+        # (directorio, mtime) o el de mtime y se para al llegar al límite, sin ordenar nada en memoria.
+        consulta = "SELECT ruta, tamano, mtime FROM archivos"
+        condiciones, parametros = [], []
+        if not recursivo:
+            condiciones.append("directorio = ''")
+        if desde is not None:
+            condiciones.append("mtime > ?")
+            parametros.append(desde)
+        if hasta is not None:
+            condiciones.append("mtime <= ?")
+            parametros.append(hasta)
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += " ORDER BY mtime DESC"
+        if limite is not None:
+            consulta += " LIMIT ? OFFSET ?"
+            parametros += [limite, saltar]
+        with self._lock:
+            return self._conexion.execute(consulta, parametros).fetchall()
+
+
+def abrir_indice(carpeta, exclusiones=None):
+    if not usar_indice:
+        return None
+    try:
+        return IndiceCarpeta(carpeta, exclusiones=exclusiones)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+# ------------------ VIGILANCIA EN VIVO ------------------
+# Mantiene el índice y el panel al día aplicando deltas. En Linux usa inotify (vía ctypes);
+# si no está disponible (o se agotan los watches) compara periódicamente los mtimes de las carpetas.
+intervalo_sondeo = 2.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_MASCARA_INOTIFY = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                    | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENTO_INOTIFY = struct.Struct("iIII")
+
+
+def _cargar_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+    import ctypes.util
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def aplicar_delta(estadisticas, delta):
+    for clave in ("archivos", "carpetas", "archivos_totales", "carpetas_totales", "bytes"):
+        estadisticas[clave] = estadisticas.get(clave, 0) + delta[clave]
+    if "profundidad" in delta:
+        estadisticas["profundidad"] = delta["profundidad"]
+    for categoria, valores in delta["por_categoria"].items():
+        destino = estadisticas["por_categoria"].setdefault(categoria, {"archivos": 0, "bytes": 0})
+        destino["archivos"] += valores["archivos"]
+        destino["bytes"] += valores["bytes"]
+    return estadisticas
+
+
+def _delta_tiene_cambios(delta):
+    return any(delta[clave] for clave in ("archivos", "carpetas", "archivos_totales", "carpetas_totales", "bytes")) \
+        or any(valores["archivos"] or valores["bytes"] for valores in delta["por_categoria"].values())
+
+
+class VigilanteCarpeta:
+    def __init__(self, indice, delta_callback, intervalo=intervalo_sondeo):
+        self.indice = indice
+        self.delta_callback = delta_callback
+        self.intervalo = intervalo
+        self.modo = None
+        self._detener = threading.Event()
+        self._hilo = None
+        self._libc = None
+        self._fd = None
+        self._watches = {}
+
+    @property
+    def al_dia(self):
+        # Con inotify también llegan las modificaciones de archivos; el sondeo solo ve cambios de carpetas
+        return self.modo == "inotify" and self._hilo is not None
+
+    def iniciar(self):
+        self._detener.clear()
+        self._libc = _cargar_inotify()
+        self.modo = "inotify" if self._libc is not None and self._iniciar_inotify() else "sondeo"
+        objetivo = self._bucle_inotify if self.modo == "inotify" else self._bucle_sondeo
+        self._hilo = threading.Thread(target=objetivo, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=5)
+        self._hilo = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches = {}
+
+    # ---- inotify ----
+    def _iniciar_inotify(self):
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        self._fd = fd
+        try:
+            for relativa, _ in self.indice.directorios():
+                self._vigilar(relativa)
+        except OSError:
+            # Normalmente ENOSPC: se ha superado fs.inotify.max_user_watches
+            os.close(fd)
+            self._fd = None
+            self._watches = {}
+            return False
+        return True
+
+    def _vigilar(self, relativa):
+        ruta = os.fsencode(self.indice._absoluta(relativa))
+        wd = self._libc.inotify_add_watch(self._fd, ruta, _MASCARA_INOTIFY)
+        if wd < 0:
+            import ctypes
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                return
+            raise OSError(error, os.strerror(error), self.indice._absoluta(relativa))
+        self._watches[wd] = relativa
+
+    def _bucle_inotify(self):
+        pendientes = set()
+        nuevas = set()
+        desde = None  # cuándo llegó el evento más antiguo sin aplicar
+        while not self._detener.is_set():
+            # Se aplica todo lo acumulado de una vez tras un instante sin eventos, o como mucho cada
+            # 'intervalo' segundos aunque no dejen de llegar (una carpeta de descargas con actividad continua)
+            if pendientes and time.monotonic() - desde >= self.intervalo:
+                self._procesar(pendientes, nuevas)
+                pendientes, nuevas, desde = set(), set(), None
+            listos, _, _ = select.select([self._fd], [], [], 0.25)
+            if not listos:
+                if pendientes:
+                    self._procesar(pendientes, nuevas)
+                    pendientes, nuevas, desde = set(), set(), None
+                continue
+            try:
+                datos = os.read(self._fd, 65536)
+            except BlockingIOError:
+                continue
+            desplazamiento = 0
+            while desplazamiento < len(datos):
+                wd, mascara, _, longitud = _EVENTO_INOTIFY.unpack_from(datos, desplazamiento)
+                desplazamiento += _EVENTO_INOTIFY.size
+                nombre = os.fsdecode(datos[desplazamiento:desplazamiento + longitud].rstrip(b"\0"))
+                desplazamiento += longitud
+                if mascara & IN_Q_OVERFLOW:
+                    pendientes.add(None)
+                    continue
+                relativa = self._watches.get(wd)
+                if relativa is None:
+                    continue
+                if mascara & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    self._watches.pop(wd, None)
+                    if mascara & IN_MOVE_SELF:
+                        self._libc.inotify_rm_watch(self._fd, wd)
+                    continue
+                pendientes.add(relativa)
+                if mascara & IN_ISDIR and mascara & (IN_CREATE | IN_MOVED_TO):
+                    nuevas.add(os.path.join(relativa, nombre))
+            if pendientes and desde is None:
+                desde = time.monotonic()
+
+    def _procesar(self, pendientes, nuevas):
+        delta = _delta_vacio(self.indice.clasificador.categorias)
+        if None in pendientes:
+            # Cola de eventos desbordada: se revisa todo el árbol por mtime
+            aplicar_delta(delta, self.indice.actualizar())
+        else:
+            for relativa in sorted(pendientes, key=len):
+                aplicar_delta(delta, self.indice.reindexar_directorio(relativa))
+        vigiladas = set(self._watches.values())
+        for raiz in nuevas:
+            for relativa, _ in self.indice.directorios(raiz):
+                if relativa not in vigiladas:
+                    try:
+                        self._vigilar(relativa)
+                    except OSError:
+                        continue
+                    # Lo creado entre el listado y el alta del watch no generó eventos
+                    aplicar_delta(delta, self.indice.reindexar_directorio(relativa))
+        self._notificar(delta)
+
+    def _notificar(self, delta):
+        if _delta_tiene_cambios(delta):
+            delta["profundidad"] = self.indice.profundidad()
+            self.delta_callback(delta)
+
+    # ---- sondeo ----
+    def _bucle_sondeo(self):
+        while not self._detener.wait(self.intervalo):
+            delta = _delta_vacio(self.indice.clasificador.categorias)
+            for relativa, mtime in self.indice.directorios():
+                if self._detener.is_set():
+                    return
+                try:
+                    actual = os.stat(self.indice._absoluta(relativa)).st_mtime
+                except OSError:
+                    continue
+                if actual != mtime:
+                    aplicar_delta(delta, self.indice.reindexar_directorio(relativa))
+            self._notificar(delta)
+
+
+def formatear_tamano(size_bytes):
+    if size_bytes == 0:
+        return "0 KB"
+    units = ["B", "KB", "MB", "GB", "TB"]
+    i = 0
+    while size_bytes >= 1024 and i < len(units) - 1:
+        size_bytes /= 1024
+        i += 1
+    return f"{size_bytes:.2f} {units[i]}"
+
+
+# ------------------ VISOR DE RESULTADOS ------------------
+# Ventana con un ttk.Treeview que solo tiene tantas filas como caben en pantalla: al desplazarse se
+# rellenan con la parte visible de los resultados, así que da igual que sean cien o un millón.
+filas_visor = 25
+alto_fila_visor = 20  # píxeles por fila si el tema no dice otra cosa
+# clave, título, ancho en píxeles, función que da el texto (None = tal cual) y si se puede ordenar
+ColumnaVisor = namedtuple("ColumnaVisor", ["clave", "titulo", "ancho", "formato", "ordenable"])
+
+
+def _formatear_fecha(mtime):
+    return f"{datetime.fromtimestamp(mtime):%Y-%m-%d %H:%M}"
+
+
+COLUMNAS_RECIENTES = (
+    ColumnaVisor("ruta", "Archivo", 330, None, False),
+    ColumnaVisor("tamano", "Tamaño", 90, formatear_tamano, True),
+    ColumnaVisor("mtime", "Modificado", 130, _formatear_fecha, True),
+    ColumnaVisor("categoria", "Categoría", 120, None, True),
+)
+COLUMNAS_DUPLICADOS = (
+    ColumnaVisor("grupo", "Grupo", 60, None, True),
+    ColumnaVisor("ruta", "Archivo", 390, None, False),
+    ColumnaVisor("tamano", "Tamaño", 90, formatear_tamano, True),
+    ColumnaVisor("categoria", "Categoría", 120, None, True),
+)
+COLUMNAS_PLAN = (
+    ColumnaVisor("origen", "Archivo", 250, None, False),
+    ColumnaVisor("destino", "Destino", 250, None, False),
+    ColumnaVisor("categoria", "Categoría", 110, None, True),
+    ColumnaVisor("tamano", "Tamaño", 90, formatear_tamano, True),
+)
+
+
+def _relativa_a(carpeta):
+    # Más barato que os.path.relpath por fila: los resultados siempre cuelgan de la carpeta
+    prefijo = os.path.join(os.path.abspath(carpeta), "")
+    return lambda ruta: ruta[len(prefijo):] if ruta.startswith(prefijo) else ruta
+
+
+def filas_recientes(archivos, carpeta, clasificador=None):
+    clasificador = clasificador or CLASIFICADOR
+    relativa = _relativa_a(carpeta)
+    return [(relativa(archivo.ruta), archivo.tamano, archivo.mtime,
+             clasificador.categoria(os.path.basename(archivo.ruta))) for archivo in archivos]
+
+
+def filas_duplicados(grupos, carpeta, clasificador=None):
+    clasificador = clasificador or CLASIFICADOR
+    relativa = _relativa_a(carpeta)
+    return [(numero, relativa(ruta), grupo.tamano, clasificador.categoria(os.path.basename(ruta)))
+            for numero, grupo in enumerate(grupos, 1) for ruta in grupo.rutas]
+
+
+def filas_plan(plan, carpeta):
+    relativa = _relativa_a(carpeta)
+    return [(relativa(movimiento.origen), relativa(movimiento.destino), movimiento.categoria, movimiento.tamano)
+            for movimiento in plan]
+
+
+class ResultadosVirtuales:
+    # Los datos del visor, sin nada de Tk. Las filas se guardan con sus valores crudos y solo se formatean
+    # las que se piden. Cada columna ordenable tiene un índice (array de posiciones ordenadas) que sirve para
+    # los dos sentidos: reordenar otra vez no vuelve a ordenar nada. preparar() los calcula todos de una vez
+    # (desde un hilo aparte); si no, se calcula cada uno la primera vez que se pide.
+    def __init__(self, columnas, filas):
+        self.columnas = tuple(columnas)
+        self.filas = filas if isinstance(filas, list) else list(filas)
+        self.columna_orden = None
+        self.ascendente = True
+        self._indices = {}
+        self._orden = None
+
+    def __len__(self):
+        return len(self.filas)
+
+    def indice(self, clave):
+        orden = self._indices.get(clave)
+        if orden is None:
+            posicion = [columna.clave for columna in self.columnas].index(clave)
+            filas = self.filas
+            orden = self._indices[clave] = array("I", sorted(range(len(filas)), key=lambda i: filas[i][posicion]))
+        return orden
+
+    def preparar(self):
+        for columna in self.columnas:
+            if columna.ordenable:
+                self.indice(columna.clave)
+        return self
+
+    def ordenar(self, clave, ascendente=None):
+        # Sin sentido explícito, pulsar dos veces la misma columna lo invierte
+        if ascendente is None:
+            ascendente = not self.ascendente if clave == self.columna_orden else True
+        self._orden = self.indice(clave)
+        self.columna_orden, self.ascendente = clave, ascendente
+
+    def fila(self, i):
+        # Fila en la posición i del orden actual, con sus valores crudos
+        if self._orden is not None:
+            i = self._orden[i] if self.ascendente else self._orden[len(self._orden) - 1 - i]
+        return self.filas[i]
+
+    def ventana(self, inicio, numero):
+        # Textos de las filas [inicio, inicio + numero) tal como se muestran
+        return [tuple(valor if columna.formato is None else columna.formato(valor)
+                      for columna, valor in zip(self.columnas, self.fila(i)))
+                for i in range(max(inicio, 0), min(inicio + numero, len(self.filas)))]
+
+
+class VisorResultados:
+    def __init__(self, padre, titulo, columnas, filas, resumen=None):
+        # filas puede ser ya un ResultadosVirtuales preparado en otro hilo, para no ordenar en el de Tk
+        _cargar_tkinter()
+        self.modelo = filas if isinstance(filas, ResultadosVirtuales) else ResultadosVirtuales(columnas, filas)
+        self.inicio = 0
+        self.seleccionada = None  # posición en el orden actual, no el item de Tk (los items se reutilizan)
+        self.ventana = tk.Toplevel(padre)
+        self.ventana.title(titulo)
+        ancho = sum(columna.ancho for columna in columnas) + 40
+        self.ventana.geometry(f"{ancho}x{filas_visor * alto_fila_visor + 90}")
+
+        marco = tk.Frame(self.ventana)
+        marco.pack(fill="both", expand=True, padx=5, pady=5)
+        self.arbol = ttk.Treeview(marco, columns=[columna.clave for columna in columnas], show="headings",
+                                  height=filas_visor, selectmode="browse")
+        for columna in columnas:
+            self.arbol.heading(columna.clave, text=columna.titulo,
+                               command=(lambda clave=columna.clave: self.ordenar(clave)) if columna.ordenable else "")
+            self.arbol.column(columna.clave, width=columna.ancho,
+                              anchor="e" if columna.formato is formatear_tamano else "w")
+        self.barra = ttk.Scrollbar(marco, orient="vertical", command=self._desde_barra)
+        self.barra.pack(side="right", fill="y")
+        self.arbol.pack(side="left", fill="both", expand=True)
+        tk.Label(self.ventana, text=resumen or f"{len(self.modelo)} resultados", anchor="w").pack(fill="x", padx=5)
+
+        self._items = []
+        self._visibles = 0
+        self._ajustar(filas_visor)
+        for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.arbol.bind(evento, self._rueda)
+        for tecla, paso in (("<Up>", -1), ("<Down>", 1), ("<Prior>", None), ("<Next>", None)):
+            self.arbol.bind(tecla, lambda evento, paso=paso, tecla=tecla: self._teclado(paso, tecla))
+        self.arbol.bind("<Home>", lambda evento: self._seleccionar(0))
+        self.arbol.bind("<End>", lambda evento: self._seleccionar(len(self.modelo) - 1))
+        self.arbol.bind("<<TreeviewSelect>>", self._al_seleccionar)
+        self.arbol.bind("<Configure>", self._al_redimensionar)
+
+    def _ajustar(self, visibles):
+        # Solo existen 'visibles' items en el Treeview; se crean o se borran al cambiar el alto
+        visibles = max(1, min(visibles, len(self.modelo)))
+        while len(self._items) < visibles:
+            self._items.append(self.arbol.insert("", "end", values=()))
+        while len(self._items) > visibles:
+            self.arbol.delete(self._items.pop())
+        self._visibles = visibles
+        self._pintar()
+
+    def _al_redimensionar(self, evento):
+        estilo = ttk.Style(self.arbol)
+        alto = int(estilo.lookup("Treeview", "rowheight") or alto_fila_visor)
+        visibles = max(1, (evento.height - alto) // alto)  # menos la fila de títulos
+        if visibles != self._visibles:
+            self._ajustar(visibles)
+
+    def _pintar(self):
+        total = len(self.modelo)
+        self.inicio = max(0, min(self.inicio, total - self._visibles))
+        for item, valores in zip(self._items, self.modelo.ventana(self.inicio, self._visibles)):
+            self.arbol.item(item, values=valores)
+        if self.seleccionada is not None and self.inicio <= self.seleccionada < self.inicio + self._visibles:
+            self.arbol.selection_set(self._items[self.seleccionada - self.inicio])
+        else:
+            self.arbol.selection_set(())
+        if total:
+            self.barra.set(self.inicio / total, (self.inicio + self._visibles) / total)
+        else:
+            self.barra.set(0, 1)
+
+    def desplazar_a(self, inicio):
+        self.inicio = inicio
+        self._pintar()
+
+    def _desde_barra(self, accion, cantidad, unidad=None):
+        if accion == "moveto":
+            self.desplazar_a(int(float(cantidad) * len(self.modelo)))
+        elif accion == "scroll":
+            self.desplazar_a(self.inicio + int(cantidad) * (self._visibles if unidad == "pages" else 1))
+
+    def _rueda(self, evento):
+        if evento.num == 4 or getattr(evento, "delta", 0) > 0:
+            self.desplazar_a(self.inicio - 3)
+        else:
+            self.desplazar_a(self.inicio + 3)
+        return "break"
+
+    def _teclado(self, paso, tecla):
+        actual = self.seleccionada if self.seleccionada is not None else self.inicio
+        if paso is None:
+            paso = self._visibles if tecla == "<Next>" else -self._visibles
+        self._seleccionar(actual + paso)
+        return "break"
+
+    def _seleccionar(self, posicion):
+        if not len(self.modelo):
+            return "break"
+        self.seleccionada = max(0, min(posicion, len(self.modelo) - 1))
+        if self.seleccionada < self.inicio:
+            self.inicio = self.seleccionada
+        elif self.seleccionada >= self.inicio + self._visibles:
+            self.inicio = self.seleccionada - self._visibles + 1
+        self._pintar()
+        return "break"
+
+    def _al_seleccionar(self, evento):
+        seleccion = self.arbol.selection()
+        if seleccion and seleccion[0] in self._items:
+            self.seleccionada = self.inicio + self._items.index(seleccion[0])
+
+    def ordenar(self, clave):
+        self.modelo.ordenar(clave)
+        for columna in self.modelo.columnas:
+            flecha = ""
+            if columna.clave == clave:
+                flecha = " ▲" if self.modelo.ascendente else " ▼"
+            self.arbol.heading(columna.clave, text=columna.titulo + flecha)
+        self.seleccionada = None
+        self.desplazar_a(0)
 
 
 class FolderWizardApp:
     def __init__(self, root):
+        _cargar_tkinter()
         self.root = root
         self.root.title(f"{nombre_ventana}")
         self.root.geometry(f"{resolucion}")
         self.root.resizable(False, False)
         self.root.configure(bg="#ECE9D8")
         self.folder_path = {carpeta_por_defecto}
+        self._cancelar_estadisticas = None
+        self._estadisticas = None
+        self._vigilante = None
 
         self.frame_welcome = tk.Frame(root, bg="#ECE9D8")
         self.frame_select = tk.Frame(root, bg="#ECE9D8")
@@ -202,14 +2977,31 @@ class FolderWizardApp:
         tk.Label(acciones_frame, text="Acciones disponibles",
             font=("Tahoma", 12, "bold"), bg="#ECE9D8").pack(pady=10)
 
+        self.formato_var = tk.StringVar(value=formato_por_defecto)
+        self.perfil_var = tk.StringVar(value=perfil_por_defecto)
+        self.modo_var = tk.StringVar(value="completo")
+        self.hash_var = tk.BooleanVar(value=False)
         acciones = [
             ("Organizar Archivos", self.organizar_archivos),
+            ("Ver Plan", self.ver_plan),
             ("Comprimir Carpeta", self.comprimir_carpeta),
+            ("Opciones de compresión", self.opciones_compresion),
             ("Archivos últimos 7 días", self.archivos_recientes),
-            ("Deshacer Última Acción", self.deshacer)
+            ("Buscar Repetidos", self.buscar_repetidos),
+            ("Unificar Repetidos", self.unificar_repetidos),
+            ("Deshacer Última Acción", self.deshacer),
+            ("Rehacer Acción", self.rehacer)
         ]
         for texto, cmd in acciones:
             tk.Button(acciones_frame, text=texto, width=20, command=cmd, bg="#ECE9D8").pack(pady=5)
+        self.recursivo_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(acciones_frame, text="Organizar también subcarpetas", variable=self.recursivo_var,
+                       bg="#ECE9D8").pack(pady=5)
+        self.duplicados_var = tk.StringVar(value=modo_duplicados)
+        duplicados_frame = tk.Frame(acciones_frame, bg="#ECE9D8")
+        duplicados_frame.pack(pady=5)
+        tk.Label(duplicados_frame, text="Archivos repetidos:", bg="#ECE9D8").pack(side="left")
+        tk.OptionMenu(duplicados_frame, self.duplicados_var, *MODOS_DUPLICADOS).pack(side="left")
 
         stats_frame = tk.Frame(content_frame, bg="#D4D0C8", relief="sunken", borderwidth=2)
         stats_frame.pack(side="left", fill="y", padx=20, pady=5)
@@ -228,7 +3020,10 @@ class FolderWizardApp:
         self.txt_niveles = tk.Entry(stats_frame, width=15, state="disabled", justify="center")
         self.txt_niveles.pack(pady=5)
         tk.Button(stats_frame, text="⟳", width=4,
-                  command=self.actualizar_estadisticas, bg="#ECE9D8", font=("Tahoma", 12, "bold")).pack(pady=15)
+                  command=self.actualizar_estadisticas, bg="#ECE9D8", font=("Tahoma", 12, "bold")).pack(pady=(15, 0))
+        self.vigilar_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(stats_frame, text="Vigilar cambios", variable=self.vigilar_var,
+                       command=self.alternar_vigilancia, bg="#D4D0C8").pack(pady=5)
         self.root.after(100, self.actualizar_estadisticas)
 
         self._crear_botones_navegacion(frame, volver=lambda: self.enseniar_frame(self.frame_select))
@@ -284,6 +3079,29 @@ class FolderWizardApp:
         self.folder_label.insert(0, self.folder_path)
         self.folder_label.config(state="disabled")
         self.actualizar_estadisticas()
+        self.alternar_vigilancia()
+        carpeta = self.folder_path
+
+        def preguntar(interrumpida):
+            # Si mientras tanto se eligió otra carpeta, la pregunta ya no viene al caso
+            if carpeta != self.folder_path:
+                return
+            if messagebox.askyesno(
+                    "Organización incompleta",
+                    f"La última organización de esta carpeta se interrumpió con {len(interrumpida.movimientos)} "
+                    "archivos ya movidos.\n¿Quieres deshacerla?"):
+                self.deshacer()
+
+        def tarea():
+            # Leer el diario entero puede tardar: se hace fuera del hilo de Tk
+            try:
+                interrumpida = operacion_interrumpida(carpeta)
+            except (OSError, ValueError):
+                return
+            if interrumpida is not None:
+                self.root.after(0, lambda: preguntar(interrumpida))
+
+        threading.Thread(target=tarea, daemon=True).start()
 
     def organizar_archivos(self):
         if not self.folder_path:
@@ -291,18 +3109,40 @@ class FolderWizardApp:
             return
 
         def tarea():
+            indice = abrir_indice(self.folder_path)
             try:
-                resultado = organizar_carpeta(self.folder_path)
+                resultado = organizar_carpeta(self.folder_path, indice=indice, recursivo=self.recursivo_var.get(),
+                                              duplicados=self.duplicados_var.get())
                 messagebox.showinfo("Éxito", resultado)
-                self.actualizar_estadisticas()
+                self.root.after(0, self.actualizar_estadisticas)
             except Exception as e:
                 messagebox.showerror("Error", str(e))
             finally:
+                if indice is not None:
+                    indice.cerrar()
                 self.root.after(0, self.ocultar_barra_estado)
 
         self.mostrar_barra_estado(modo_indeterminado=True)  # barra animada
         threading.Thread(target=tarea, daemon=True).start()
 
+    def unificar_repetidos(self):
+        if not self.folder_path:
+            messagebox.showwarning("Advertencia", "Primero selecciona una carpeta.")
+            return
+
+        def tarea():
+            try:
+                metodo = "clon" if self.duplicados_var.get() == "clonar" else metodo_deduplicado
+                messagebox.showinfo("Éxito", deduplicar_carpeta(self.folder_path, metodo=metodo))
+                self.root.after(0, self.actualizar_estadisticas)
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+            finally:
+                self.root.after(0, self.ocultar_barra_estado)
+
+        self.mostrar_barra_estado(modo_indeterminado=True)
+        threading.Thread(target=tarea, daemon=True).start()
+
     def comprimir_carpeta(self):
         if not self.folder_path:
             messagebox.showwarning("Advertencia", "Primero selecciona una carpeta.")
@@ -311,12 +3151,17 @@ class FolderWizardApp:
         def tarea():
             try:
                 def progreso(i, total):
-                    porcentaje = int(i * 100 / total)
+                    porcentaje = int(i * 100 / total) if total else 100
                     self.root.after(0, lambda: self.actualizar_barra_progreso(porcentaje))
 
-                zip_path = comprimir_carpeta_entera(self.folder_path, progreso_callback=progreso)
+                zip_path = comprimir_carpeta_entera(self.folder_path, progreso_callback=progreso,
+                                                    formato=self.formato_var.get(), perfil=self.perfil_var.get(),
+                                                    modo=self.modo_var.get(), usar_hash=self.hash_var.get())
                 self.root.after(0, lambda: self.actualizar_barra_progreso(100))
-                messagebox.showinfo("Éxito", f"Carpeta comprimida correctamente:\n{zip_path}")
+                if zip_path is None:
+                    messagebox.showinfo("Éxito", "No hay cambios desde la última copia.")
+                else:
+                    messagebox.showinfo("Éxito", f"Carpeta comprimida correctamente:\n{zip_path}")
             except Exception as e:
                 messagebox.showerror("Error", str(e))
             finally:
@@ -325,15 +3170,142 @@ class FolderWizardApp:
         self.mostrar_barra_estado(modo_indeterminado=False)  # barra con progreso real
         threading.Thread(target=tarea, daemon=True).start()
 
+    def opciones_compresion(self):
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Opciones de compresión")
+        ventana.configure(bg="#ECE9D8")
+        ventana.resizable(False, False)
+        ventana.transient(self.root)
+
+        tk.Label(ventana, text="Formato:", bg="#ECE9D8", font=("Tahoma", 10, "bold")).grid(
+            row=0, column=0, sticky="w", padx=10, pady=5)
+        tk.OptionMenu(ventana, self.formato_var, *formatos_disponibles()).grid(
+            row=0, column=1, sticky="ew", padx=10, pady=5)
+        tk.Label(ventana, text="Perfil:", bg="#ECE9D8", font=("Tahoma", 10, "bold")).grid(
+            row=1, column=0, sticky="w", padx=10, pady=5)
+        tk.OptionMenu(ventana, self.perfil_var, *PERFILES_COMPRESION).grid(
+            row=1, column=1, sticky="ew", padx=10, pady=5)
+        tk.Label(ventana, text="Modo:", bg="#ECE9D8", font=("Tahoma", 10, "bold")).grid(
+            row=2, column=0, sticky="w", padx=10, pady=5)
+        tk.OptionMenu(ventana, self.modo_var, *MODOS_COMPRESION).grid(
+            row=2, column=1, sticky="ew", padx=10, pady=5)
+        tk.Checkbutton(ventana, text="Comparar contenido (hash)", variable=self.hash_var, bg="#ECE9D8").grid(
+            row=3, column=0, columnspan=2, sticky="w", padx=10, pady=5)
+
+        resultado = tk.Label(ventana, text="", bg="#ECE9D8", justify="left", font=("Courier", 9))
+        resultado.grid(row=5, column=0, columnspan=2, padx=10, pady=5)
+        tk.Button(ventana, text="Medir rendimiento", width=18, command=lambda: self._medir_perfiles(resultado),
+                  bg="#ECE9D8").grid(row=4, column=0, padx=10, pady=10)
+        tk.Button(ventana, text="Cerrar", width=12, command=ventana.destroy, bg="#ECE9D8").grid(
+            row=4, column=1, padx=10, pady=10)
+
+    def _medir_perfiles(self, etiqueta):
+        if not self.folder_path:
+            messagebox.showwarning("Advertencia", "Primero selecciona una carpeta.")
+            return
+        etiqueta.config(text="Midiendo, por favor espere...")
+        carpeta = self.folder_path
+
+        def tarea():
+            try:
+                lineas = [f"{r['formato']:<12} {r['perfil']:<12} {r['mb_s']:>8.1f} MB/s   ratio {r['ratio']:.3f}"
+                          for r in medir_perfiles(carpeta)]
+                texto = "\n".join(lineas) or "La carpeta no tiene archivos para medir."
+            except Exception as e:
+                texto = f"Error: {e}"
+            self.root.after(0, lambda: etiqueta.winfo_exists() and etiqueta.config(text=texto))
+
+        threading.Thread(target=tarea, daemon=True).start()
+
     def archivos_recientes(self):
         if not self.folder_path:
             messagebox.showwarning("Advertencia", "Primero selecciona una carpeta.")
             return
-        recientes = obtener_archivos_recientes(self.folder_path)
-        if not recientes:
-            messagebox.showinfo("Archivos recientes", "No se encontraron archivos modificados en los últimos 7 días.")
-        else:
-            messagebox.showinfo("Archivos recientes", f"Archivos modificados en los últimos 7 días:\n\n" + "\n".join(recientes))
+        # El índice solo sirve si el vigilante lo mantiene al día; si no, se recorre el disco
+        vigilante = self._vigilante
+        indice = vigilante.indice if vigilante is not None and vigilante.al_dia else None
+        carpeta, recursivo = self.folder_path, self.recursivo_var.get()
+
+        def mostrar(filas):
+            self.ocultar_barra_estado()
+            if not filas:
+                messagebox.showinfo("Archivos recientes",
+                                    "No se encontraron archivos modificados en los últimos 7 días.")
+                return
+            VisorResultados(self.root, "Archivos modificados en los últimos 7 días", COLUMNAS_RECIENTES, filas)
+
+        def tarea():
+            try:
+                recientes = buscar_recientes(carpeta, time.time() - 7 * 24 * 3600, recursivo=recursivo,
+                                             indice=indice)
+                filas = ResultadosVirtuales(COLUMNAS_RECIENTES, filas_recientes(recientes, carpeta)).preparar()
+            except Exception as e:
+                self.root.after(0, self.ocultar_barra_estado)
+                messagebox.showerror("Error", str(e))
+                return
+            self.root.after(0, lambda: mostrar(filas))
+
+        self.mostrar_barra_estado("Buscando archivos recientes...", modo_indeterminado=True)
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def buscar_repetidos(self):
+        if not self.folder_path:
+            messagebox.showwarning("Advertencia", "Primero selecciona una carpeta.")
+            return
+
+        carpeta = self.folder_path
+
+        def mostrar(filas, resumen):
+            self.ocultar_barra_estado()
+            if not filas:
+                messagebox.showinfo("Archivos repetidos", "No hay archivos repetidos.")
+                return
+            VisorResultados(self.root, "Archivos repetidos", COLUMNAS_DUPLICADOS, filas, resumen)
+
+        def tarea():
+            try:
+                grupos = buscar_duplicados(carpeta)
+                filas = ResultadosVirtuales(COLUMNAS_DUPLICADOS, filas_duplicados(grupos, carpeta)).preparar()
+                recuperable = formatear_tamano(sum(grupo.tamano * (len(grupo.rutas) - 1) for grupo in grupos))
+                resumen = f"{len(grupos)} grupos de archivos iguales; se pueden liberar {recuperable}"
+            except Exception as e:
+                self.root.after(0, self.ocultar_barra_estado)
+                messagebox.showerror("Error", str(e))
+                return
+            self.root.after(0, lambda: mostrar(filas, resumen))
+
+        self.mostrar_barra_estado("Buscando archivos repetidos...", modo_indeterminado=True)
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def ver_plan(self):
+        # Lo que haría "Organizar Archivos", sin mover nada
+        if not self.folder_path:
+            messagebox.showwarning("Advertencia", "Primero selecciona una carpeta.")
+            return
+        carpeta, recursivo = self.folder_path, self.recursivo_var.get()
+
+        def mostrar(filas):
+            self.ocultar_barra_estado()
+            if not filas:
+                messagebox.showinfo("Plan de organización", "No hay archivos que organizar.")
+                return
+            VisorResultados(self.root, "Plan de organización", COLUMNAS_PLAN, filas)
+
+        def tarea():
+            try:
+                if recursivo:
+                    plan = recorrer_organizables(carpeta)
+                else:
+                    plan = planificar_organizacion(carpeta)
+                filas = ResultadosVirtuales(COLUMNAS_PLAN, filas_plan(plan, carpeta)).preparar()
+            except OSError as e:
+                self.root.after(0, self.ocultar_barra_estado)
+                messagebox.showerror("Error", str(e))
+                return
+            self.root.after(0, lambda: mostrar(filas))
+
+        self.mostrar_barra_estado("Calculando el plan...", modo_indeterminado=True)
+        threading.Thread(target=tarea, daemon=True).start()
 
     def deshacer(self):
         if not self.folder_path:
@@ -342,9 +3314,27 @@ class FolderWizardApp:
 
         def tarea():
             try:
-                resultado = deshacer_accion()
+                resultado = deshacer_accion(self.folder_path)
                 messagebox.showinfo("Deshacer", resultado)
-                self.actualizar_estadisticas()
+                self.root.after(0, self.actualizar_estadisticas)
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+            finally:
+                self.root.after(0, self.ocultar_barra_estado)
+
+        self.mostrar_barra_estado(modo_indeterminado=True)  # barra animada
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def rehacer(self):
+        if not self.folder_path:
+            messagebox.showwarning("Advertencia", "No hay carpeta seleccionada.")
+            return
+
+        def tarea():
+            try:
+                resultado = rehacer_accion(self.folder_path)
+                messagebox.showinfo("Rehacer", resultado)
+                self.root.after(0, self.actualizar_estadisticas)
             except Exception as e:
                 messagebox.showerror("Error", str(e))
             finally:
@@ -354,34 +3344,107 @@ class FolderWizardApp:
         threading.Thread(target=tarea, daemon=True).start()
 
     def actualizar_estadisticas(self):
+        # Cancela el recorrido anterior (p. ej. al elegir otra carpeta) antes de lanzar uno nuevo
+        if self._cancelar_estadisticas is not None:
+            self._cancelar_estadisticas.set()
+            self._cancelar_estadisticas = None
         if not self.folder_path:
             self._set_stat_fields("-", "-", "-", "-")
             return
-        try:
-            num_archivos = len([f for f in Path(self.folder_path).iterdir()
-                                if f.is_file() and f.name.lower() != "desktop.ini" and f.suffix.lower() != ".ini"])
-            num_carpetas = len([f for f in Path(self.folder_path).iterdir() if f.is_dir()])
 
-            total_size = 0
-            for f in Path(self.folder_path).glob("**/*"):
-                if f.is_file():
+        carpeta = self.folder_path
+        cancelar = threading.Event()
+        self._cancelar_estadisticas = cancelar
+
+        def parcial(estadisticas):
+            self.root.after(0, lambda: self._mostrar_estadisticas(estadisticas, cancelar))
+
+        def tarea():
+            # Con índice previo basta con revisar las carpetas modificadas; si no, se recorre el árbol
+            # mostrando parciales y después se construye el índice para los siguientes refrescos.
+            indice = None
+            try:
+                indexada = IndiceCarpeta.existe(carpeta)
+                if indexada:
+                    indice = abrir_indice(carpeta)
+                if indice is not None:
+                    if indice.actualizar(cancelar) is None:
+                        return
+                    estadisticas = indice.estadisticas()
+                else:
+                    estadisticas = calcular_estadisticas(carpeta, cancelar=cancelar, progreso_callback=parcial)
+            except Exception:
+                self.root.after(0, lambda: self._mostrar_estadisticas(None, cancelar))
+                return
+            finally:
+                if indice is not None:
+                    indice.cerrar()
+            if estadisticas is None:
+                return
+            self.root.after(0, lambda: self._mostrar_estadisticas(estadisticas, cancelar, final=True))
+            if not indexada:
+                indice = abrir_indice(carpeta)
+                if indice is not None:
                     try:
-                        total_size += os.path.getsize(f)
-                    except:
+                        indice.actualizar(cancelar)
+                    except Exception:
                         pass
-            size_formatted = self._format_size(total_size)
+                    finally:
+                        indice.cerrar()
 
-            profundidad = 0
-            for f in Path(self.folder_path).glob("**/*"):
-                if f.is_dir():
-                    nivel = len(f.relative_to(Path(self.folder_path)).parts)
-                    if nivel > profundidad:
-                        profundidad = nivel
-
-            self._set_stat_fields(num_archivos, num_carpetas, size_formatted, profundidad)
+        threading.Thread(target=tarea, daemon=True).start()
 
-        except Exception:
+    def _mostrar_estadisticas(self, estadisticas, cancelar, final=False):
+        if cancelar.is_set():
+            return
+        if estadisticas is None:
             self._set_stat_fields("ERR", "ERR", "ERR", "ERR")
+            return
+        if final:
+            self._estadisticas = estadisticas
+        self._set_stat_fields(estadisticas["archivos"], estadisticas["carpetas"],
+                              self._format_size(estadisticas["bytes"]), estadisticas["profundidad"])
+
+    def alternar_vigilancia(self):
+        if self._vigilante is not None:
+            vigilante, self._vigilante = self._vigilante, None
+            threading.Thread(target=lambda: (vigilante.detener(), vigilante.indice.cerrar()), daemon=True).start()
+        if not self.vigilar_var.get() or not self.folder_path:
+            return
+        carpeta = self.folder_path
+
+        def tarea():
+            indice = abrir_indice(carpeta)
+            if indice is None:
+                return
+            try:
+                indice.actualizar()
+                estadisticas = indice.estadisticas()
+            except Exception:
+                indice.cerrar()
+                return
+            vigilante = VigilanteCarpeta(
+                indice, lambda delta: self.root.after(0, lambda: self._aplicar_delta_panel(delta, vigilante)))
+            vigilante.iniciar()
+            self.root.after(0, lambda: self._activar_vigilante(vigilante, carpeta, estadisticas))
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def _activar_vigilante(self, vigilante, carpeta, estadisticas):
+        # El usuario pudo desmarcar la casilla o cambiar de carpeta mientras se preparaba el índice
+        if not self.vigilar_var.get() or carpeta != self.folder_path or self._vigilante is not None:
+            vigilante.detener()
+            vigilante.indice.cerrar()
+            return
+        self._vigilante = vigilante
+        self._estadisticas = estadisticas
+        self._mostrar_estadisticas(estadisticas, threading.Event())
+
+    def _aplicar_delta_panel(self, delta, vigilante):
+        if vigilante is not self._vigilante or self._estadisticas is None:
+            return
+        aplicar_delta(self._estadisticas, delta)
+        self._mostrar_estadisticas(self._estadisticas, threading.Event())
 
     def _set_stat_fields(self, archivos, carpetas, peso, niveles):
         self.txt_archivos.config(state="normal")
@@ -406,14 +3469,7 @@ class FolderWizardApp:
         self.actualizar_estadisticas()
 
     def _format_size(self, size_bytes):
-        if size_bytes == 0:
-            return "0 KB"
-        units = ["B", "KB", "MB", "GB", "TB"]
-        i = 0
-        while size_bytes >= 1024 and i < len(units) - 1:
-            size_bytes /= 1024
-            i += 1
-        return f"{size_bytes:.2f} {units[i]}"
+        return formatear_tamano(size_bytes)
 
     def _crear_top_bar(self, frame, titulo):
         top_bar = tk.Frame(frame, bg="#245EDC", height=40)
@@ -435,6 +3491,7 @@ class FolderWizardApp:
             tk.Label(image_frame, text="Logo", bg="#D4D0C8", font=("Tahoma", 12, "bold")).pack(expand=True)
 
 if __name__ == "__main__":
+    _cargar_tkinter()
     root = tk.Tk()
     # ===== Configuración de fuente Roboto =======
     font_path = os.path.join(os.path.dirname(__file__), "fuentes", "Roboto-Regular.ttf")
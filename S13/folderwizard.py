@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import bloque_mejoras_AntonioRomeroGarcia as fw
+
+
+# ------------------ FolderWizard sin interfaz gráfica ------------------
+# Uso: python -m folderwizard [--json] <orden> ...   (pensado para cron y servidores sin pantalla)
+
+
+def _mostrar(args, datos, texto):
+    if args.json:
+        print(json.dumps(datos, ensure_ascii=False, indent=2))
+    else:
+        print(texto)
+
+
+def _exclusiones(args):
+    patrones = () if args.sin_exclusiones else fw.EXCLUSIONES_POR_DEFECTO
+    return fw.ReglasExclusion(patrones + tuple(args.excluir))
+
+
+def _opciones_exclusion(parser):
+    parser.add_argument("--excluir", action="append", default=[], metavar="PATRON",
+                        help="patrón estilo .gitignore que se salta (se puede repetir)")
+    parser.add_argument("--sin-exclusiones", action="store_true",
+                        help="no aplica las exclusiones por defecto (.git, node_modules, cachés...)")
+
+
+def orden_organizar(args):
+    if args.recursivo:
+        # Generador: el árbol se recorre y se mueve por lotes sin guardar la lista entera
+        plan = fw.recorrer_organizables(args.carpeta, exclusiones=_exclusiones(args))
+    else:
+        plan = fw.planificar_organizacion(args.carpeta, exclusiones=_exclusiones(args))
+    if args.simular:
+        if args.json:
+            print(fw.plan_a_json(tuple(plan)))
+        else:
+            for movimiento in plan:
+                print(f"{movimiento.origen} -> {movimiento.destino}")
+        return 0
+    if args.guardar_plan:
+        plan = tuple(plan)
+
+    error = None
+    try:
+        resultado = fw.organizar_carpeta(args.carpeta, hilos=args.hilos, plan=plan, duplicados=args.duplicados)
+    except OSError as e:
+        resultado, error = None, e
+    if args.guardar_plan:
+        # Se guarda lo que realmente se movió (con su nombre final) para poder deshacerlo más tarde
+        destinos = {origen: destino for destino, origen in fw.ultima_accion}
+        hechos = tuple(movimiento._replace(destino=destinos[movimiento.origen],
+                                           nombre=os.path.basename(destinos[movimiento.origen]))
+                       for movimiento in plan if movimiento.origen in destinos)
+        with open(args.guardar_plan, "w", encoding="utf-8") as f:
+            f.write(fw.plan_a_json(hechos))
+
+    _mostrar(args, {"movidos": len(fw.ultima_accion), "error": str(error) if error else None,
+                    "plan": args.guardar_plan,
+                    "duplicados": [{"ruta": ruta, "original": original} for ruta, original in fw.ultimos_duplicados]},
+             resultado if error is None else f"Error: {error}")
+    return 0 if error is None else 1
+
+
+def _datos_informe(informe):
+    if informe is None:
+        return {"restaurados": 0, "renombrados": [], "fallidos": []}
+    return {"restaurados": informe.restaurados,
+            "renombrados": [{"original": original, "final": final} for original, final in informe.renombrados],
+            "fallidos": [{"ruta": ruta, "error": str(error)} for ruta, error in informe.fallidos]}
+
+
+def orden_deshacer(args):
+    fw.ultimo_informe = None
+    if args.carpeta:
+        resultado = fw.deshacer_accion(args.carpeta, hilos=args.hilos)
+    elif args.plan:
+        with open(args.plan, encoding="utf-8") as f:
+            plan = fw.plan_desde_json(f.read())
+        resultado = fw.deshacer_plan(plan, hilos=args.hilos)
+    else:
+        print("Error: indica un archivo de plan o --carpeta.", file=sys.stderr)
+        return 2
+    informe = fw.ultimo_informe
+    _mostrar(args, _datos_informe(informe), resultado)
+    return 1 if informe is not None and informe.fallidos else 0
+
+
+def orden_rehacer(args):
+    _mostrar(args, {"carpeta": args.carpeta}, fw.rehacer_accion(args.carpeta, hilos=args.hilos))
+    return 0
+
+
+def orden_historial(args):
+    deshacer, rehacer = [], []
+    diario = fw.abrir_diario(args.carpeta) if fw.DiarioMovimientos.existe(args.carpeta) else None
+    if diario is not None:
+        try:
+            deshacer, rehacer = diario.historial()
+        finally:
+            diario.cerrar()
+    datos = {nombre: [{"id": op.id, "fecha": op.fecha, "terminada": op.terminada, "archivos": len(op.movimientos)}
+                      for op in reversed(lista)] for nombre, lista in (("deshacer", deshacer), ("rehacer", rehacer))}
+    lineas = []
+    for nombre, operaciones in datos.items():
+        lineas.append(f"Para {nombre}:")
+        lineas.extend(f"  {datetime.fromtimestamp(op['fecha']):%Y-%m-%d %H:%M:%S}  {op['archivos']} archivos"
+                      + ("" if op["terminada"] else "  (interrumpida)") for op in operaciones)
+    _mostrar(args, datos, "\n".join(lineas))
+    return 0
+
+
+def orden_duplicados(args):
+    grupos = fw.buscar_duplicados(args.carpeta, hilos=args.hilos, exclusiones=_exclusiones(args))
+    lineas = []
+    for grupo in grupos:
+        lineas.append(f"{fw.formatear_tamano(grupo.tamano)} x {len(grupo.rutas)}")
+        lineas.extend(f"  {ruta}" for ruta in grupo.rutas)
+    _mostrar(args, [grupo._asdict() for grupo in grupos], "\n".join(lineas) or "No hay archivos repetidos.")
+    return 0
+
+
+def orden_deduplicar(args):
+    resultado = fw.deduplicar_carpeta(args.carpeta, metodo=args.metodo, hilos=args.hilos,
+                                      exclusiones=_exclusiones(args))
+    _mostrar(args, {"unificados": len(fw.ultima_accion)}, resultado)
+    return 0
+
+
+def orden_comprimir(args):
+    zip_path = fw.comprimir_carpeta_entera(args.carpeta, formato=args.formato, perfil=args.perfil,
+                                           modo=args.modo, usar_hash=args.hash, exclusiones=_exclusiones(args))
+    if zip_path is None:
+        _mostrar(args, {"archivo": None}, "No hay cambios desde la última copia.")
+    else:
+        _mostrar(args, {"archivo": str(zip_path)}, f"Carpeta comprimida correctamente:\n{zip_path}")
+    return 0
+
+
+def orden_medir(args):
+    resultados = fw.medir_perfiles(args.carpeta, muestra=args.muestra * 1024 * 1024,
+                                   exclusiones=_exclusiones(args))
+    _mostrar(args, resultados, "\n".join(
+        f"{r['formato']:<12} {r['perfil']:<12} {r['mb_s']:>8.1f} MB/s   ratio {r['ratio']:.3f}" for r in resultados))
+    return 0
+
+
+def orden_recientes(args):
+    # La ventana es (desde, hasta]: por defecto los últimos --dias hasta ahora
+    desde = datetime.fromisoformat(args.desde).timestamp() if args.desde else time.time() - args.dias * 24 * 3600
+    hasta = datetime.fromisoformat(args.hasta).timestamp() if args.hasta else None
+    # Sin vigilante el índice no ve los archivos editados en el sitio: siempre se recorre el disco
+    recientes = fw.buscar_recientes(args.carpeta, desde, hasta, recursivo=args.recursivo, limite=args.limite,
+                                    pagina=args.pagina, exclusiones=_exclusiones(args))
+    _mostrar(args, [archivo._asdict() for archivo in recientes], "\n".join(
+        f"{datetime.fromtimestamp(archivo.mtime):%Y-%m-%d %H:%M}  {fw.formatear_tamano(archivo.tamano):>10}  "
+        f"{os.path.relpath(archivo.ruta, args.carpeta)}" for archivo in recientes))
+    return 0
+
+
+def orden_estadisticas(args):
+    estadisticas = fw.calcular_estadisticas(args.carpeta, exclusiones=_exclusiones(args))
+    _mostrar(args, estadisticas,
+             f"Archivos: {estadisticas['archivos']}\n"
+             f"Carpetas: {estadisticas['carpetas']}\n"
+             f"Peso total: {fw.formatear_tamano(estadisticas['bytes'])}\n"
+             f"Número de subcarpetas: {estadisticas['profundidad']}")
+    return 0
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(prog="folderwizard", description="Asistente de organización de archivos")
+    parser.add_argument("--json", action="store_true", help="muestra el resultado en formato JSON")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+
+    organizar = ordenes.add_parser("organizar", help="organiza los archivos de una carpeta por tipo")
+    organizar.add_argument("carpeta")
+    organizar.add_argument("--hilos", type=int, default=fw.hilos_movimiento, help="hilos para mover archivos")
+    organizar.add_argument("--simular", action="store_true", help="muestra el plan sin mover nada")
+    organizar.add_argument("--guardar-plan", metavar="ARCHIVO", help="guarda los movimientos para deshacerlos")
+    organizar.add_argument("--recursivo", action="store_true",
+                           help="organiza también los archivos de las subcarpetas")
+    organizar.add_argument("--duplicados", choices=fw.MODOS_DUPLICADOS, default=fw.modo_duplicados,
+                           help="qué hacer con los archivos idénticos a uno que ya está en su carpeta de destino")
+    _opciones_exclusion(organizar)
+    organizar.set_defaults(funcion=orden_organizar)
+
+    deshacer = ordenes.add_parser("deshacer", help="deshace una organización guardada con --guardar-plan "
+                                                    "o, con --carpeta, la última registrada en el diario")
+    deshacer.add_argument("plan", metavar="ARCHIVO", nargs="?")
+    deshacer.add_argument("--carpeta",
+                          help="deshace la última organización de la carpeta (aunque quedara a medias)")
+    deshacer.add_argument("--hilos", type=int, default=fw.hilos_movimiento, help="hilos para mover archivos")
+    deshacer.set_defaults(funcion=orden_deshacer)
+
+    rehacer = ordenes.add_parser("rehacer", help="vuelve a aplicar la última organización deshecha")
+    rehacer.add_argument("carpeta")
+    rehacer.add_argument("--hilos", type=int, default=fw.hilos_movimiento, help="hilos para mover archivos")
+    rehacer.set_defaults(funcion=orden_rehacer)
+
+    historial = ordenes.add_parser("historial", help="muestra las organizaciones que se pueden deshacer y rehacer")
+    historial.add_argument("carpeta")
+    historial.set_defaults(funcion=orden_historial)
+
+    duplicados = ordenes.add_parser("duplicados", help="busca archivos con el mismo contenido")
+    duplicados.add_argument("carpeta")
+    duplicados.add_argument("--hilos", type=int, default=fw.hilos_hash, help="hilos para calcular los hashes")
+    _opciones_exclusion(duplicados)
+    duplicados.set_defaults(funcion=orden_duplicados)
+
+    deduplicar = ordenes.add_parser("deduplicar", help="sustituye las copias repetidas por enlaces o clones "
+                                                        "del original sin mover ninguna ruta (se puede deshacer)")
+    deduplicar.add_argument("carpeta")
+    deduplicar.add_argument("--metodo", choices=fw.METODOS_ENLACE, default=fw.metodo_deduplicado,
+                            help="enlace duro o clon (reflink, solo en sistemas de archivos que lo admiten)")
+    deduplicar.add_argument("--hilos", type=int, default=fw.hilos_hash, help="hilos para calcular los hashes")
+    _opciones_exclusion(deduplicar)
+    deduplicar.set_defaults(funcion=orden_deduplicar)
+
+    comprimir = ordenes.add_parser("comprimir", help="comprime la carpeta entera (ZIP o tar)")
+    comprimir.add_argument("carpeta")
+    comprimir.add_argument("--formato", choices=fw.formatos_disponibles(), default=fw.formato_por_defecto)
+    comprimir.add_argument("--perfil", choices=list(fw.PERFILES_COMPRESION), default=fw.perfil_por_defecto)
+    comprimir.add_argument("--modo", choices=fw.MODOS_COMPRESION, default="completo",
+                           help="anexar o diferencial guardan solo lo cambiado desde la última copia completa")
+    comprimir.add_argument("--hash", action="store_true", help="compara el contenido además de tamaño y fecha")
+    _opciones_exclusion(comprimir)
+    comprimir.set_defaults(funcion=orden_comprimir)
+
+    medir = ordenes.add_parser("medir", help="mide velocidad y ratio de cada formato y perfil de compresión")
+    medir.add_argument("carpeta")
+    medir.add_argument("--muestra", type=int, default=fw.muestra_medicion // (1024 * 1024), metavar="MB",
+                       help="megabytes de la carpeta que se usan como muestra")
+    _opciones_exclusion(medir)
+    medir.set_defaults(funcion=orden_medir)
+
+    recientes = ordenes.add_parser("recientes", help="lista los archivos modificados recientemente")
+    recientes.add_argument("carpeta")
+    recientes.add_argument("--dias", type=float, default=7, help="días hacia atrás desde ahora")
+    recientes.add_argument("--desde", metavar="FECHA", help="inicio de la ventana (ISO, p. ej. 2024-05-01T08:00)")
+    recientes.add_argument("--hasta", metavar="FECHA", help="fin de la ventana (ISO)")
+    recientes.add_argument("--recursivo", action="store_true", help="incluye las subcarpetas")
+    recientes.add_argument("--limite", type=int, metavar="N", help="solo los N más recientes (por página)")
+    recientes.add_argument("--pagina", type=int, default=0, help="página de --limite resultados (desde 0)")
+    _opciones_exclusion(recientes)
+    recientes.set_defaults(funcion=orden_recientes)
+
+    estadisticas = ordenes.add_parser("estadisticas", help="muestra las estadísticas de la carpeta")
+    estadisticas.add_argument("carpeta")
+    _opciones_exclusion(estadisticas)
+    estadisticas.set_defaults(funcion=orden_estadisticas)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    try:
+        return args.funcion(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())